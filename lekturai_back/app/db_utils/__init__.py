@@ -1,5 +1,57 @@
 # database/__init__.py (jeśli tworzysz pakiet)
-from .db_service import FirestoreManager
+import threading
+from typing import TYPE_CHECKING, Any, Optional
 
-# Globalna instancja, która zostanie utworzona raz przy starcie serwera
-db_manager = FirestoreManager()
\ No newline at end of file
+if TYPE_CHECKING:
+    from .db_service import FirestoreManager
+
+
+class _LazyManager:
+    """
+    Global FirestoreManager, built on first use instead of at import time:
+    importing the app neither loads firebase_admin nor needs credentials.
+    The app's lifespan builds it during warm-up (see app.services.warmup).
+    """
+
+    def __init__(self) -> None:
+        self._manager: Optional["FirestoreManager"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._manager is not None
+
+    def get(self) -> "FirestoreManager":
+        if self._manager is None:
+            with self._lock:
+                if self._manager is None:
+                    from .db_service import FirestoreManager
+
+                    self._manager = FirestoreManager()
+        return self._manager
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+_lazy_manager = _LazyManager()
+
+# Globalna instancja (tworzona przy pierwszym użyciu, zwykle podczas rozgrzewki serwera)
+db_manager: "FirestoreManager" = _lazy_manager  # type: ignore[assignment]
+
+
+def get_db_manager() -> "FirestoreManager":
+    return _lazy_manager.get()
+
+
+def db_manager_initialized() -> bool:
+    return _lazy_manager.initialized
+
+
+def __getattr__(name: str) -> Any:
+    # `from app.db_utils import FirestoreManager` keeps working without an eager import
+    if name == "FirestoreManager":
+        from .db_service import FirestoreManager
+
+        return FirestoreManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
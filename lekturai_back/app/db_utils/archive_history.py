@@ -0,0 +1,146 @@
+# archive_history.py
+
+import argparse
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from app.db_utils.batch_jobs import BatchJob
+from app.db_utils.db_service import (
+    FirestoreManager,
+    UserHistoryEntry,
+    decode_history_bundle,
+    history_bundle_fields,
+    pack_history_bundles,
+)
+from app.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Firestore batches are limited to 500 operations
+BATCH_LIMIT = 400
+
+
+def _archive_user(manager: FirestoreManager, user_ref: Any, cutoff: datetime) -> int:
+    """Moves the user's history entries older than `cutoff` into monthly bundles."""
+    history_ref = user_ref.collection(manager.HISTORY_SUBCOLLECTION)
+    archive_ref = user_ref.collection(manager.HISTORY_ARCHIVE_SUBCOLLECTION)
+
+    by_month: Dict[str, List[Tuple[Any, UserHistoryEntry]]] = defaultdict(list)
+    for doc in history_ref.where("date", "<", cutoff).stream():
+        entry = UserHistoryEntry(**doc.to_dict(), doc_id=doc.id)
+        by_month[entry.date.strftime("%Y-%m")].append((doc.reference, entry))
+
+    archived = 0
+    for month, items in by_month.items():
+        # Merge with what is already archived for this month (re-runs are idempotent)
+        old_parts = list(archive_ref.where("month", "==", month).stream())
+        entries = {
+            e.id: e
+            for part in old_parts
+            for e in decode_history_bundle((part.to_dict() or {})["data"])
+        }
+        entries.update({e.id: e for _, e in items})
+        ordered = sorted(entries.values(), key=lambda e: (e.date, e.id or ""))
+
+        # 1. Write the new bundles (and drop parts that are no longer used)
+        batch = manager.db.batch()
+        new_ids = set()
+        for part, (part_entries, data) in enumerate(
+            pack_history_bundles(ordered, manager.HISTORY_ARCHIVE_MAX_BYTES)
+        ):
+            part_id = f"{month}-p{part:02d}"
+            new_ids.add(part_id)
+            batch.set(
+                archive_ref.document(part_id),
+                {"month": month, "part": part, **history_bundle_fields(part_entries, data)},
+            )
+        for old_part in old_parts:
+            if old_part.id not in new_ids:
+                batch.delete(old_part.reference)
+        batch.commit()
+
+        # 2. Only then delete the hot documents
+        batch = manager.db.batch()
+        ops = 0
+        for doc_ref, _ in items:
+            batch.delete(doc_ref)
+            ops += 1
+            if ops >= BATCH_LIMIT:
+                batch.commit()
+                batch = manager.db.batch()
+                ops = 0
+        if ops:
+            batch.commit()
+
+        archived += len(items)
+    return archived
+
+
+class HistoryArchiveJob(BatchJob):
+    """
+    Archives the old history of every user (see _archive_user).
+
+    The stats collection is split with partition queries (every user with
+    history has a stats document: both are written by the grading
+    transaction) and users are processed in parallel. Archiving a user
+    is idempotent, so resumed runs simply continue after the last user of
+    the checkpoint.
+    """
+
+    name = "archive_history"
+
+    def __init__(self, manager: FirestoreManager, cutoff: datetime, **kwargs: Any) -> None:
+        super().__init__(manager, **kwargs)
+        self.cutoff = cutoff
+
+    def run_key(self) -> str:
+        return self.cutoff.date().isoformat()
+
+    def partitions(self) -> List[Any]:
+        return self.scan_partitions(self.manager.STATS_COLLECTION, select=["points"])
+
+    def process(self, doc: Any, writer: Any) -> str:
+        # Bundles must be written before the hot documents are deleted, so
+        # _archive_user commits its own batches rather than using `writer`
+        count = _archive_user(self.manager, doc.reference, self.cutoff)
+        if not count:
+            return "unchanged"
+        self._count("entries", count)
+        return "archived"
+
+
+def run_archive(older_than_days: int, resume: bool = True) -> None:
+    """
+    Offline compaction of history.
+
+    For every user, entries older than `older_than_days` are grouped by
+    month, compressed into HISTORY_ARCHIVE_SUBCOLLECTION bundles and
+    removed from HISTORY_SUBCOLLECTION. FirestoreManager merges bundles
+    back into history reads, so clients see no difference.
+    """
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    logger.info("Archiving entries older than %s.", cutoff.date())
+    HistoryArchiveJob(manager, cutoff, resume=resume).run()
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.archive_history --older-than-days 180
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Archive old history into monthly bundles.")
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=int(os.getenv("HISTORY_ARCHIVE_AFTER_DAYS", "180")),
+    )
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the stored checkpoint.")
+    args = parser.parse_args()
+    run_archive(args.older_than_days, not args.no_resume)
@@ -0,0 +1,29 @@
+# backend.py
+
+import functools
+from typing import Any, Callable
+
+from app.db_utils.memory_store import MemoryTransaction
+from app.import_utils import lazy_module
+
+# FirestoreManager runs on the Firestore client or, with STORAGE_BACKEND=memory,
+# on the in-memory store (memory_store.py). Helpers that have to tell the two
+# apart live here, so the store stays a plain stand-in for the client API.
+
+_transaction = lazy_module("google.cloud.firestore_v1.transaction")
+
+
+def transactional(func: Callable[..., Any]) -> Callable[..., Any]:
+    """firestore.transactional that also runs functions in a MemoryTransaction."""
+    firestore_func = None
+
+    @functools.wraps(func)
+    def wrapper(transaction: Any, *args: Any, **kwargs: Any) -> Any:
+        nonlocal firestore_func
+        if isinstance(transaction, MemoryTransaction):
+            return transaction.run(func, *args, **kwargs)
+        if firestore_func is None:
+            firestore_func = _transaction.transactional(func)
+        return firestore_func(transaction, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,111 @@
+# backfill_group_daily_stats.py
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from app.db_utils.db_service import FirestoreManager, group_doc_ids_for_user
+from app.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Max number of references passed to a single get_all call
+READ_CHUNK = 300
+# Firestore batches are limited to 500 operations
+BATCH_LIMIT = 400
+
+
+def _window_date_ids(days: int) -> List[str]:
+    today = datetime.now(timezone.utc).date()
+    return [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def run_backfill() -> None:
+    """
+    Rebuilds GROUP_DAILY_STATS_COLLECTION from the per-user daily stats.
+
+    1. Stream all users and assign them to their school and class groups.
+    2. Read each user's DAILY_STATS_COLLECTION document (chunked get_all).
+    3. Overwrite every group document with the summed points and
+       active-user counts for the current 30-day window.
+
+    Rollup documents are overwritten, so the job can be re-run safely.
+    Run it once after deploying the rollups, before traffic relies on them.
+    """
+    logger.info("--- Starting Group Daily Stats Backfill: %s ---", datetime.now(timezone.utc))
+
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    date_ids = set(_window_date_ids(manager.DAILY_STATS_DAYS))
+
+    try:
+        groups_by_user: Dict[str, List[str]] = {}
+        group_meta: Dict[str, Dict[str, str]] = {}
+        for doc in manager.db.collection(manager.USERS_COLLECTION).stream():
+            data = doc.to_dict() or {}
+            group_ids = group_doc_ids_for_user(data)
+            if not group_ids:
+                continue
+            groups_by_user[doc.id] = group_ids
+            group_meta[group_ids[0]] = {"city": data["city"], "school": data["school"]}
+            if len(group_ids) > 1:
+                group_meta[group_ids[1]] = {
+                    "city": data["city"],
+                    "school": data["school"],
+                    "className": data["className"],
+                }
+    except Exception as e:
+        logger.error("Unable to fetch list of users: %s", e)
+        return
+
+    logger.info("Processing %s users in %s groups.", len(groups_by_user), len(group_meta))
+
+    points: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    active: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    user_ids = list(groups_by_user)
+    for i in range(0, len(user_ids), READ_CHUNK):
+        refs = [
+            manager.db.collection(manager.DAILY_STATS_COLLECTION).document(u_id)
+            for u_id in user_ids[i : i + READ_CHUNK]
+        ]
+        for daily_doc in manager.db.get_all(refs):
+            if not daily_doc.exists:
+                continue
+            points_by_day = (daily_doc.to_dict() or {}).get("points_by_day", {})
+            for date_id, day_points in points_by_day.items():
+                if date_id not in date_ids:
+                    continue
+                for group_id in groups_by_user[daily_doc.id]:
+                    points[group_id][date_id] += day_points
+                    active[group_id][date_id] += 1
+
+    batch = manager.db.batch()
+    ops = 0
+    for group_id, meta in group_meta.items():
+        days = {
+            date_id: {"points": points[group_id][date_id], "active": active[group_id][date_id]}
+            for date_id in points[group_id]
+        }
+        ref = manager.db.collection(manager.GROUP_DAILY_STATS_COLLECTION).document(group_id)
+        batch.set(ref, {**meta, "days": days})
+        ops += 1
+        if ops >= BATCH_LIMIT:
+            batch.commit()
+            batch = manager.db.batch()
+            ops = 0
+    if ops:
+        batch.commit()
+
+    logger.info("--- Finished Group Daily Stats Backfill (%s groups) ---", len(group_meta))
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.backfill_group_daily_stats
+    setup_logging()
+    run_backfill()
@@ -0,0 +1,156 @@
+# backfill_group_stats.py
+
+import argparse
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from app.db_utils.db_service import FirestoreManager, group_doc_ids_for_user
+from app.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Max number of references passed to a single get_all call
+READ_CHUNK = 300
+# Firestore batches are limited to 500 operations
+BATCH_LIMIT = 400
+
+
+def run_backfill(repair_only: bool = False) -> None:
+    """
+    Rebuilds the sharded school/class counters in GROUP_STATS_COLLECTION
+    and the top-K lists in LEADERBOARDS_COLLECTION.
+
+    1. Stream all users and assign them to their school and class groups.
+    2. Read their all-time stats (chunked get_all) and sum points and streaks.
+    3. Write the totals into shard 0 and reset the remaining shards.
+    4. Write the best LEADERBOARD_SIZE students of every group.
+
+    Increments that land between steps 2 and 3 are lost, so run it
+    when no exercises are being graded.
+
+    With `repair_only`, only the boards recorded in
+    LEADERBOARD_REPAIRS_COLLECTION (updates that failed in the API) are
+    rebuilt; counters are left alone, so it is safe to run at any time.
+    Both modes remove the records they repaired, unless the board failed
+    again meanwhile.
+    """
+    logger.info("--- Starting Group Stats & Leaderboards Backfill: %s ---", datetime.now(timezone.utc))
+
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    # Read before the users, so records written later are kept for the next run
+    try:
+        repairs = list(manager.db.collection(manager.LEADERBOARD_REPAIRS_COLLECTION).stream())
+    except Exception as e:
+        logger.error("Unable to fetch leaderboard repairs: %s", e)
+        return
+    repair_ids = {doc.id for doc in repairs}
+    if repair_only and not repairs:
+        logger.info("No leaderboards to repair.")
+        return
+
+    try:
+        groups_by_user: Dict[str, List[str]] = {}
+        names_by_user: Dict[str, str] = {}
+        for doc in manager.db.collection(manager.USERS_COLLECTION).stream():
+            data = doc.to_dict() or {}
+            group_ids = group_doc_ids_for_user(data)
+            if repair_only:
+                group_ids = [group_id for group_id in group_ids if group_id in repair_ids]
+            if group_ids:
+                groups_by_user[doc.id] = group_ids
+                names_by_user[doc.id] = data.get("displayName", "")
+    except Exception as e:
+        logger.error("Unable to fetch list of users: %s", e)
+        return
+
+    # Every known group gets its shards reset, even if no member has stats yet
+    totals: Dict[str, Dict[str, int]] = {
+        group_id: {"points_sum": 0, "streak_sum": 0, "students": 0}
+        for group_ids in groups_by_user.values()
+        for group_id in group_ids
+    }
+    boards: Dict[str, List[Dict[str, Any]]] = {group_id: [] for group_id in totals}
+    if repair_only:
+        # A recorded board may have no members left; it is emptied
+        boards.update({group_id: [] for group_id in repair_ids if group_id not in boards})
+
+    user_ids = list(groups_by_user)
+    for i in range(0, len(user_ids), READ_CHUNK):
+        refs = [
+            manager.db.collection(manager.STATS_COLLECTION).document(u_id)
+            for u_id in user_ids[i : i + READ_CHUNK]
+        ]
+        for stats_doc in manager.db.get_all(refs):
+            if not stats_doc.exists:
+                continue
+            data = stats_doc.to_dict() or {}
+            entry = {
+                "user_id": stats_doc.id,
+                "display_name": names_by_user[stats_doc.id],
+                "points": data.get("points", 0),
+                "current_streak": data.get("current_streak", 0),
+                "last_task_date": data.get("last_task_date"),
+            }
+            for group_id in groups_by_user[stats_doc.id]:
+                totals[group_id]["points_sum"] += data.get("points", 0)
+                totals[group_id]["streak_sum"] += data.get("current_streak", 0)
+                totals[group_id]["students"] += 1
+                boards[group_id].append(entry)
+
+    logger.info("Processing %s users in %s groups.", len(user_ids), len(totals))
+
+    batch = manager.db.batch()
+    ops = 0
+    for group_id, group_totals in ({} if repair_only else totals).items():
+        shards = (
+            manager.db.collection(manager.GROUP_STATS_COLLECTION)
+            .document(group_id)
+            .collection(manager.GROUP_STATS_SHARDS_SUBCOLLECTION)
+        )
+        for shard_id in range(manager.GROUP_STATS_NUM_SHARDS):
+            data = group_totals if shard_id == 0 else {"points_sum": 0, "streak_sum": 0, "students": 0}
+            batch.set(shards.document(str(shard_id)), data)
+            ops += 1
+            if ops >= BATCH_LIMIT:
+                batch.commit()
+                batch = manager.db.batch()
+                ops = 0
+
+    for group_id in boards:
+        entries = sorted(boards[group_id], key=lambda e: e["points"], reverse=True)
+        board_ref = manager.db.collection(manager.LEADERBOARDS_COLLECTION).document(group_id)
+        batch.set(board_ref, {"entries": entries[: manager.LEADERBOARD_SIZE]})
+        ops += 1
+        if ops >= BATCH_LIMIT:
+            batch.commit()
+            batch = manager.db.batch()
+            ops = 0
+    if ops:
+        batch.commit()
+
+    for doc in repairs:
+        try:
+            doc.reference.delete(option=manager.db.write_option(last_update_time=doc.update_time))
+        except Exception as e:
+            logger.warning("Leaderboard %s failed again during the repair: %s", doc.id, e)
+    if repairs:
+        logger.info("Repaired %s leaderboards.", len(repairs))
+
+    logger.info("--- Finished Group Stats Backfill ---")
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.backfill_group_stats [--repair]
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Rebuild school/class counters and leaderboards.")
+    parser.add_argument(
+        "--repair", action="store_true", help="Only rebuild the leaderboards whose updates failed."
+    )
+    args = parser.parse_args()
+    run_backfill(args.repair)
@@ -0,0 +1,367 @@
+# batch_jobs.py
+
+import abc
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Counter as CounterType, Dict, List, Optional
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.db_utils.db_service import FirestoreManager
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Spaces out calls to at most `per_second` across all threads (None = unlimited)."""
+
+    def __init__(self, per_second: Optional[float] = None) -> None:
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self) -> None:
+        if not self.per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + 1.0 / self.per_second
+        if wait > 0:
+            time.sleep(wait)
+
+
+class DryRunWriter:
+    """Stands in for a BulkWriter / WriteBatch and only counts the writes."""
+
+    def __init__(self) -> None:
+        self.ops = 0
+        self._lock = threading.Lock()
+
+    def _count(self, *args: Any, **kwargs: Any) -> None:
+        with self._lock:
+            self.ops += 1
+
+    create = set = update = delete = _count
+
+    def commit(self) -> List[Any]:
+        return []
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class LockedWriter:
+    """BulkWriter is not thread-safe; workers of one partition share it through this."""
+
+    def __init__(self, writer: Any) -> None:
+        self._writer = writer
+        self._lock = threading.Lock()
+
+    def _locked(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return method(*args, **kwargs)
+
+    def create(self, *args: Any, **kwargs: Any) -> Any:
+        return self._locked(self._writer.create, *args, **kwargs)
+
+    def set(self, *args: Any, **kwargs: Any) -> Any:
+        return self._locked(self._writer.set, *args, **kwargs)
+
+    def update(self, *args: Any, **kwargs: Any) -> Any:
+        return self._locked(self._writer.update, *args, **kwargs)
+
+    def delete(self, *args: Any, **kwargs: Any) -> Any:
+        return self._locked(self._writer.delete, *args, **kwargs)
+
+    def flush(self) -> None:
+        self._locked(self._writer.flush)
+
+    def close(self) -> None:
+        self._locked(self._writer.close)
+
+
+class BatchJob(abc.ABC):
+    """
+    Base class for resumable maintenance jobs.
+
+    A job splits its input into partitions (queries), reads every partition
+    page by page in parallel and hands each document to `process()` on a
+    small worker pool. After each page the writes are flushed and the last
+    processed document is stored in JOB_CHECKPOINTS_COLLECTION, so a crashed
+    run with the same `run_key()` continues where it stopped instead of
+    starting from zero. `process()` must be idempotent: a resumed run may see
+    the documents of an unfinished page again.
+
+    Subclasses set `name` and implement `partitions()` and `process()`.
+    """
+
+    name = "batch_job"
+    # Requested number of partitions (Firestore may return fewer)
+    num_partitions = 8
+    # Threads calling process() within one partition
+    workers_per_partition = 4
+    # Documents read per query page (a checkpoint is stored after each page)
+    page_size = 300
+
+    def __init__(
+        self,
+        manager: FirestoreManager,
+        dry_run: bool = False,
+        resume: bool = True,
+        max_docs_per_second: Optional[float] = None,
+    ) -> None:
+        self.manager = manager
+        self.dry_run = dry_run
+        self.resume = resume
+        self.limiter = RateLimiter(max_docs_per_second)
+        self.counts: CounterType[str] = Counter()
+        self._counts_lock = threading.Lock()
+        self._checkpoint: Dict[str, Any] = {}
+        self._checkpoint_ref = manager.db.collection(
+            manager.JOB_CHECKPOINTS_COLLECTION
+        ).document(self.name)
+
+    # --- To implement in subclasses ---
+
+    def run_key(self) -> str:
+        """Checkpoints are only resumed by a run with the same key (default: today's UTC date)."""
+        return datetime.now(timezone.utc).date().isoformat()
+
+    @abc.abstractmethod
+    def partitions(self) -> List[Any]:
+        """Queries that together cover the job's input."""
+
+    @abc.abstractmethod
+    def process(self, doc: Any, writer: Any) -> Optional[str]:
+        """Handles one document; returns an outcome label counted in the run summary."""
+
+    # --- Optional hooks (the writer's callbacks run on its own threads) ---
+
+    def write_result(self, key: str, reference: Any, result: Any) -> None:
+        """A write queued to the writer of partition `key` was applied."""
+
+    def write_failed(self, key: str, failure: Any) -> bool:
+        """A write of partition `key` failed; returns True to retry it."""
+        if failure.attempts < 5:
+            return True
+        logger.error("Write failed for %s: %s", failure.operation.reference.path, failure.message)
+        self._count("failed_writes")
+        return False
+
+    def end_page(self, key: str, writer: Any) -> None:
+        """Called after a page's writes are flushed; writes queued here are flushed before the checkpoint."""
+
+    # --- Helpers for subclasses ---
+
+    def scan_partitions(self, collection_id: str, select: Optional[List[str]] = None) -> List[Any]:
+        """
+        Splits a whole collection (group) with Firestore partition queries.
+        The split points are kept in the checkpoint, so a resumed run gets
+        the same partitions.
+        """
+        boundaries = self._checkpoint.get("boundaries")
+        if boundaries is None:
+            group = self.manager.db.collection_group(collection_id)
+            boundaries = [
+                p.end_at.path for p in group.get_partitions(self.num_partitions) if p.end_at
+            ]
+            self._checkpoint["boundaries"] = boundaries
+
+        base = self.manager.db.collection_group(collection_id).order_by(
+            FieldPath.document_id()
+        )
+        if select:
+            base = base.select(select)
+
+        refs: List[Any] = [None, *(self.manager.db.document(path) for path in boundaries), None]
+        queries = []
+        for start, end in zip(refs, refs[1:]):
+            query = base
+            if start is not None:
+                query = query.start_at([start])
+            if end is not None:
+                query = query.end_before([end])
+            queries.append(query)
+        return queries
+
+    def batch(self) -> Any:
+        """Atomic batch for writes that must land together (a no-op in dry-run)."""
+        return DryRunWriter() if self.dry_run else self.manager.db.batch()
+
+    # --- Runner ---
+
+    def run(self) -> Optional[Dict[str, Any]]:
+        started_at = datetime.now(timezone.utc)
+        mode = " (dry run)" if self.dry_run else ""
+        logger.info("--- Starting %s%s: %s ---", self.name, mode, started_at)
+
+        run_key = self.run_key()
+        resumed = self._load_checkpoint(run_key)
+        if self._checkpoint.get("finished"):
+            logger.info("%s already finished for %s; use --no-resume to run again.", self.name, run_key)
+            return None
+
+        try:
+            queries = self.partitions()
+        except Exception as e:
+            logger.error("Unable to build partitions for %s: %s", self.name, e)
+            return None
+        if not resumed and not self.dry_run:
+            # Fresh run: replace whatever an older run left behind
+            self._checkpoint_ref.set(
+                {
+                    "run_key": run_key,
+                    "finished": False,
+                    "boundaries": self._checkpoint.get("boundaries"),
+                    "partitions": {},
+                    "updated_at": started_at,
+                }
+            )
+
+        states: Dict[str, Dict[str, Any]] = self._checkpoint.get("partitions", {})
+        with ThreadPoolExecutor(max_workers=max(1, len(queries))) as pool:
+            results = list(
+                pool.map(
+                    lambda item: self._run_partition(
+                        f"p{item[0]:03d}", item[1], states.get(f"p{item[0]:03d}", {})
+                    ),
+                    enumerate(queries),
+                )
+            )
+
+        finished = all(results)
+        finished_at = datetime.now(timezone.utc)
+        summary: Dict[str, Any] = {
+            "job": self.name,
+            "run_key": run_key,
+            "dry_run": self.dry_run,
+            "resumed": resumed,
+            "finished": finished,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "duration_s": round((finished_at - started_at).total_seconds(), 3),
+            "partitions": len(queries),
+            "counts": dict(self.counts),
+        }
+        self._save_checkpoint({"finished": finished})
+        if not self.dry_run:
+            try:
+                self.manager.db.collection(self.manager.JOB_RUNS_COLLECTION).add(summary)
+            except Exception as e:
+                logger.error("Unable to store run summary: %s", e)
+
+        counts = ", ".join(f"{k}: {v}" for k, v in sorted(self.counts.items())) or "nothing to do"
+        status = "Finished" if finished else "Stopped (resumable)"
+        logger.info("--- %s %s%s in %.1fs (%s) ---", status, self.name, mode, summary['duration_s'], counts)
+        return summary
+
+    def _load_checkpoint(self, run_key: str) -> bool:
+        """Returns True when an unfinished checkpoint of this run_key is resumed."""
+        self._checkpoint = {"run_key": run_key, "partitions": {}}
+        if self.dry_run or not self.resume:
+            return False
+        try:
+            doc = self._checkpoint_ref.get()
+        except Exception as e:
+            logger.error("Unable to read checkpoint of %s: %s", self.name, e)
+            return False
+        data = doc.to_dict() if doc.exists else None
+        if not data or data.get("run_key") != run_key:
+            return False
+        self._checkpoint = data
+        return not data.get("finished")
+
+    def _save_checkpoint(self, fields: Dict[str, Any]) -> None:
+        self._checkpoint.update(fields)
+        if self.dry_run:
+            return
+        self._checkpoint_ref.set(
+            {**fields, "run_key": self._checkpoint["run_key"], "updated_at": datetime.now(timezone.utc)},
+            merge=True,
+        )
+
+    def _save_partition(self, key: str, state: Dict[str, Any]) -> None:
+        if self.dry_run:
+            return
+        self._checkpoint_ref.set(
+            {"partitions": {key: state}, "updated_at": datetime.now(timezone.utc)}, merge=True
+        )
+
+    def _count(self, outcome: str, n: int = 1) -> None:
+        with self._counts_lock:
+            self.counts[outcome] += n
+
+    def _process_one(self, doc: Any, writer: Any) -> None:
+        self.limiter.acquire()
+        try:
+            outcome = self.process(doc, writer) or "processed"
+        except Exception as e:
+            logger.error("Error processing %s: %s", doc.reference.path, e)
+            outcome = "failed"
+        self._count(outcome)
+
+    def _run_partition(self, key: str, query: Any, state: Dict[str, Any]) -> bool:
+        """Processes one partition; returns False if it stopped on an error."""
+        if state.get("done"):
+            return True
+
+        processed = state.get("processed", 0)
+        writer: Any
+        if self.dry_run:
+            writer = DryRunWriter()
+        else:
+            bulk_writer = self.manager.db.bulk_writer()
+            bulk_writer.on_write_result(lambda ref, result, w: self.write_result(key, ref, result))
+            bulk_writer.on_write_error(lambda failure, w: self.write_failed(key, failure))
+            writer = LockedWriter(bulk_writer)
+
+        finished = False
+        try:
+            page_query = query
+            if state.get("last"):
+                last = self.manager.db.document(state["last"]).get()
+                if last.exists:
+                    page_query = query.start_after(last)
+
+            with ThreadPoolExecutor(max_workers=self.workers_per_partition) as pool:
+                while True:
+                    page = list(page_query.limit(self.page_size).stream())
+                    if not page:
+                        break
+                    list(pool.map(lambda doc: self._process_one(doc, writer), page))
+                    # Writes must be durable before the checkpoint moves past them
+                    writer.flush()
+                    self.end_page(key, writer)
+                    writer.flush()
+                    processed += len(page)
+                    self._save_partition(
+                        key, {"last": page[-1].reference.path, "processed": processed, "done": False}
+                    )
+                    if len(page) < self.page_size:
+                        break
+                    page_query = query.start_after(page[-1])
+            finished = True
+
+        except Exception as e:
+            logger.error("Partition %s of %s stopped: %s", key, self.name, e)
+        finally:
+            # Also after an error: writes already queued are sent, not dropped
+            try:
+                writer.close()
+            except Exception as e:
+                logger.error("Closing the writer of partition %s of %s failed: %s", key, self.name, e)
+                finished = False
+
+        if not finished:
+            self._count("partition_errors")
+            return False
+        self._save_partition(key, {"processed": processed, "done": True})
+        return True
@@ -0,0 +1,54 @@
+# build_search_index.py
+
+import logging
+from datetime import datetime, timezone
+
+from app.db_utils.db_service import FirestoreManager
+from app.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def run_build() -> None:
+    """
+    Indexes existing history entries for /history_search.
+
+    1. List every user document in STATS_COLLECTION (also ones that only hold subcollections).
+    2. Delete the user's search index, so re-runs do not add entries to it twice.
+    3. Add each history entry to the index.
+    4. Set doc_count to the number of indexed entries.
+    """
+    logger.info("--- Starting History Search Index Build: %s ---", datetime.now(timezone.utc))
+
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    users = 0
+    entries = 0
+    for user_ref in manager.db.collection(manager.STATS_COLLECTION).list_documents():
+        try:
+            manager.clear_search_index(user_ref.id)
+
+            count = 0
+            for entry in manager.iter_history_entries(user_ref.id):
+                if entry.id:
+                    manager.index_history_entry(user_ref.id, entry.id, entry)
+                    count += 1
+
+            index_ref = manager.db.collection(manager.SEARCH_INDEX_COLLECTION).document(user_ref.id)
+            index_ref.set({"doc_count": count}, merge=True)
+            users += 1
+            entries += count
+        except Exception as e:
+            logger.error("Indexing history of %s failed: %s", user_ref.id, e)
+
+    logger.info("--- Finished History Search Index Build (%s users, %s entries) ---", users, entries)
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.build_search_index
+    setup_logging()
+    run_build()
@@ -0,0 +1,149 @@
+# cache.py
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class LRUTTLCache:
+    """
+    Thread-safe per-process cache: at most `max_size` entries (least
+    recently used are evicted first), each valid for `ttl_seconds`.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class FirestoreInvalidationChannel:
+    """
+    Cross-worker invalidation through a Firestore collection.
+
+    publish() only queues the key. A background thread writes the keys
+    queued in the last `batch_seconds` as one {keys, origin, at, expire_at}
+    document, so callers never wait on Firestore and every listener reads
+    one document per batch instead of one per key. Workers that called
+    listen() get the keys published by the others through a snapshot
+    listener. Documents are only needed for a moment: configure a TTL
+    policy on `expire_at` (see README) so the collection does not grow.
+    """
+
+    # Keys per document (well below the 1 MiB document limit)
+    MAX_KEYS_PER_DOC = 500
+
+    def __init__(
+        self, db: Any, collection: str, keep_seconds: float = 3600, batch_seconds: float = 0.2
+    ) -> None:
+        self._collection = db.collection(collection)
+        self.keep_seconds = keep_seconds
+        self.batch_seconds = batch_seconds
+        self.origin = uuid.uuid4().hex
+        self._watch: Any = None
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, key: str) -> None:
+        with self._lock:
+            self._pending.add(key)
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(
+                    target=self._flush_loop, name="cache-invalidation", daemon=True
+                )
+                self._thread.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.batch_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Error publishing cache invalidations: %s", e)
+
+    def flush(self) -> int:
+        """Writes the queued keys; returns how many were published."""
+        with self._flush_lock:
+            with self._lock:
+                keys, self._pending = sorted(self._pending), set()
+            now = datetime.now(timezone.utc)
+            for i in range(0, len(keys), self.MAX_KEYS_PER_DOC):
+                self._collection.add(
+                    {
+                        "keys": keys[i : i + self.MAX_KEYS_PER_DOC],
+                        "origin": self.origin,
+                        "at": now,
+                        "expire_at": now + timedelta(seconds=self.keep_seconds),
+                    }
+                )
+            return len(keys)
+
+    def listen(self, on_invalidate: Callable[[str], None]) -> None:
+        if self._watch is not None:
+            return
+
+        def on_snapshot(docs: Any, changes: Any, read_time: Any) -> None:
+            for change in changes:
+                if change.type.name != "ADDED":
+                    continue
+                data = change.document.to_dict() or {}
+                if data.get("origin") != self.origin:
+                    for key in data.get("keys", []):
+                        on_invalidate(key)
+
+        started = datetime.now(timezone.utc)
+        self._watch = self._collection.where("at", ">", started).on_snapshot(on_snapshot)
+
+    def close(self) -> None:
+        """Publishes what is still queued and stops listening."""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Error publishing cache invalidations: %s", e)
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
@@ -0,0 +1,139 @@
+# compact_daily_stats.py
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.db_utils.db_service import FirestoreManager
+from app.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Firestore batches are limited to 500 operations
+BATCH_LIMIT = 400
+
+
+def _cutoff_date_id(days: int) -> str:
+    """Return the oldest date id (YYYY-MM-DD) that is still kept."""
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+
+def _migrate_legacy_docs(manager: FirestoreManager, cutoff: str) -> int:
+    """
+    Folds the old per-day documents (user-all-time-stats/{id}/daily-stats/{date})
+    into the per-user DAILY_STATS_COLLECTION document and deletes them.
+    """
+    migrated = 0
+    batch = manager.db.batch()
+    ops = 0
+
+    legacy_docs = manager.db.collection_group(manager.DAILY_STATS_SUBCOLLECTION).stream()
+    for doc in legacy_docs:
+        user_ref = doc.reference.parent.parent
+        if user_ref is None:
+            continue
+        user_id = user_ref.id
+        if doc.id >= cutoff:
+            points = (doc.to_dict() or {}).get("points", 0)
+            target = manager.db.collection(manager.DAILY_STATS_COLLECTION).document(user_id)
+            batch.set(
+                target,
+                {"points_by_day": {doc.id: firestore.Increment(points)}},
+                merge=True,
+            )
+            ops += 1
+        batch.delete(doc.reference)
+        ops += 1
+        migrated += 1
+
+        if ops >= BATCH_LIMIT:
+            batch.commit()
+            batch = manager.db.batch()
+            ops = 0
+
+    if ops:
+        batch.commit()
+    return migrated
+
+
+def _trim_rolling_docs(
+    manager: FirestoreManager, collection: str, field: str, cutoff: str
+) -> int:
+    """Drops days older than the retention window from every date-keyed map."""
+    trimmed_docs = 0
+    batch = manager.db.batch()
+    ops = 0
+
+    for doc in manager.db.collection(collection).stream():
+        by_day: Dict[str, Any] = (doc.to_dict() or {}).get(field, {})
+        old_days = [day for day in by_day if day < cutoff]
+        if not old_days:
+            continue
+
+        update_data = {
+            FieldPath(field, day).to_api_repr(): firestore.DELETE_FIELD
+            for day in old_days
+        }
+        batch.update(doc.reference, update_data)
+        ops += 1
+        trimmed_docs += 1
+
+        if ops >= BATCH_LIMIT:
+            batch.commit()
+            batch = manager.db.batch()
+            ops = 0
+
+    if ops:
+        batch.commit()
+    return trimmed_docs
+
+
+def run_compaction() -> None:
+    """
+    Offline retention job for daily stats.
+
+    1. Migrate legacy per-day documents into the per-user rolling document.
+    2. Remove days older than DAILY_STATS_DAYS from every per-user document
+       and every school/class rollup.
+
+    The request path never trims, so this should run once a day.
+    """
+    logger.info("--- Starting Daily Stats Compaction: %s ---", datetime.now(timezone.utc))
+
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    cutoff = _cutoff_date_id(manager.DAILY_STATS_DAYS)
+    logger.info("Keeping days from %s onwards.", cutoff)
+
+    try:
+        migrated = _migrate_legacy_docs(manager, cutoff)
+        logger.info("Migrated %s legacy daily-stats documents.", migrated)
+
+        trimmed = _trim_rolling_docs(
+            manager, manager.DAILY_STATS_COLLECTION, "points_by_day", cutoff
+        )
+        logger.info("Trimmed old days for %s users.", trimmed)
+
+        trimmed = _trim_rolling_docs(
+            manager, manager.GROUP_DAILY_STATS_COLLECTION, "days", cutoff
+        )
+        logger.info("Trimmed old days for %s school/class rollups.", trimmed)
+    except Exception as e:
+        logger.error("Daily stats compaction failed: %s", e)
+        return
+
+    logger.info("--- Finished Daily Stats Compaction ---")
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.compact_daily_stats
+    setup_logging()
+    run_compaction()
@@ -1,17 +1,28 @@
 # daily_update.py
 
-import os
+import argparse
+import logging
+import threading
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
-# Import the manager and schemas from firestore_manager.py
-# We assume that file is available for import
-from db_service import FirestoreManager, UserAllTimeStats, User
+from app.db_utils.batch_jobs import BatchJob
+from app.db_utils.db_service import FirestoreManager
+from app.logging_config import setup_logging
 
-# --- Environment Variables / Configuration ---
-# Firestore service key should be loaded
-# Make sure SERVICE_ACCOUNT_PATH in FirestoreManager is set correctly
-# or use an environment variable for dynamic loading.
+logger = logging.getLogger(__name__)
+
+# The broken-streak query is split into last_task_date ranges read in parallel.
+# Normally almost everything falls into the day before yesterday
+# ([cutoff - 1 day, cutoff), users active then but not yesterday), so that day
+# is cut into DAY_SLICES time slices; the remaining two ranges cover the past
+# week (the job did not run for a few days) and the open tail.
+# (Firestore partition queries cannot be combined with filters.)
+DAY_SLICES = 8
+PARTITIONS = DAY_SLICES + 2
+# gRPC status code returned when the update_time precondition does not hold
+FAILED_PRECONDITION = 9
 
 
 def _get_yesterday_utc() -> datetime:
@@ -22,73 +33,149 @@ def _get_yesterday_utc() -> datetime:
     return yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def run_daily_update():
+def _date_ranges(cutoff: datetime) -> List[Tuple[Optional[datetime], datetime]]:
+    """(start, end) ranges of last_task_date; start=None means no lower bound."""
+    ranges: List[Tuple[Optional[datetime], datetime]] = []
+    step = timedelta(days=1) / DAY_SLICES
+    end = cutoff
+    for _ in range(DAY_SLICES):
+        ranges.append((end - step, end))
+        end -= step
+    ranges.append((end - timedelta(days=6), end))
+    ranges.append((None, end - timedelta(days=6)))
+    return ranges
+
+
+class DailyStreakResetJob(BatchJob):
     """
-    Main daily stats update logic.
+    Resets current_streak of users who did no task yesterday.
 
-    1. Fetch list of all user_ids.
-    2. For each user_id:
-       a. Check/Create stats profile.
-       b. Update streak based on date of last task.
+    Only stats docs with current_streak > 0 and last_task_date < yesterday
+    are read (needs a composite index on current_streak, last_task_date).
+    The resets go through the partition's BulkWriter with an update_time
+    precondition, so a user who solved a task in the meantime is skipped.
+    After each page, the streaks of the resets that were applied are
+    subtracted from the school/class counters (one get_all of the users per
+    page) and the users are published as stats invalidations, whatever
+    STATS_CACHE_INVALIDATION is set to in this process, so API workers that
+    listen drop the old streaks. Reset docs drop out of the query, which
+    makes re-runs and resumed runs safe.
     """
-    print(f"--- Starting Daily Stats Update: {datetime.now(timezone.utc)} ---")
-    
+
+    name = "daily_update"
+    num_partitions = PARTITIONS
+
+    def __init__(self, manager: FirestoreManager, cutoff: datetime, **kwargs: Any) -> None:
+        super().__init__(manager, **kwargs)
+        self.cutoff = cutoff
+        self._lock = threading.Lock()
+        # stats doc path -> (user id, streak before the reset), until the write is resolved
+        self._streaks: Dict[str, Tuple[str, int]] = {}
+        # partition key -> (doc id, old streak) of the resets applied in its current page
+        self._applied: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        self._invalidation = manager.new_stats_invalidation_channel()
+
+    def run_key(self) -> str:
+        return self.cutoff.date().isoformat()
+
+    def partitions(self) -> List[Any]:
+        stats = self.manager.db.collection(self.manager.STATS_COLLECTION)
+        queries = []
+        for start, end in _date_ranges(self.cutoff):
+            query = stats.where("current_streak", ">", 0).where("last_task_date", "<", end)
+            if start is not None:
+                query = query.where("last_task_date", ">=", start)
+            queries.append(query.select(["current_streak", "last_task_date"]))
+        return queries
+
+    def process(self, doc: Any, writer: Any) -> str:
+        if self.dry_run:
+            return "reset"
+        with self._lock:
+            self._streaks[doc.reference.path] = (doc.id, (doc.to_dict() or {}).get("current_streak", 0))
+        writer.update(
+            doc.reference,
+            {"current_streak": 0},
+            option=self.manager.db.write_option(last_update_time=doc.update_time),
+        )
+        return "candidates"
+
+    def write_result(self, key: str, reference: Any, result: Any) -> None:
+        with self._lock:
+            reset = self._streaks.pop(reference.path, None)
+            if reset is None:
+                # A counter update queued by end_page()
+                return
+            self._applied[key].append(reset)
+        self._count("reset")
+
+    def write_failed(self, key: str, failure: Any) -> bool:
+        if failure.code == FAILED_PRECONDITION:
+            # Stats changed after the read (the user just solved a task)
+            with self._lock:
+                self._streaks.pop(failure.operation.reference.path, None)
+            self._count("skipped")
+            return False
+        retry = super().write_failed(key, failure)
+        if not retry:
+            with self._lock:
+                self._streaks.pop(failure.operation.reference.path, None)
+        return retry
+
+    def end_page(self, key: str, writer: Any) -> None:
+        with self._lock:
+            applied = self._applied.pop(key, [])
+        if not applied:
+            return
+
+        users = self.manager.db.collection(self.manager.USERS_COLLECTION)
+        streaks = dict(applied)
+        for user_doc in self.manager.db.get_all([users.document(doc_id) for doc_id in streaks]):
+            if user_doc.exists:
+                self.manager.add_group_stats_delta(
+                    writer, user_doc.to_dict() or {}, streak=-streaks[user_doc.id]
+                )
+        # API workers may still cache the old streaks
+        for doc_id in streaks:
+            self._invalidation.publish(doc_id)
+
+    def run(self) -> Optional[Dict[str, Any]]:
+        try:
+            return super().run()
+        finally:
+            self._invalidation.close()
+
+
+def run_daily_update(
+    dry_run: bool = False, resume: bool = True, max_docs_per_second: Optional[float] = None
+) -> None:
+    """Main daily stats update logic (see DailyStreakResetJob)."""
     try:
         # Initialize Firestore manager
         manager = FirestoreManager()
-        
-    except RuntimeError as e:
-        print(f"CRITICAL ERROR: Unable to initialize FirestoreManager. {e}")
-        return
 
-    # FirestoreManager lacks a get_all_users method.
-    # We'll use a simple function to fetch all user IDs.
-    # For a large application, pagination is recommended.
-    try:
-        user_docs = manager.db.collection(manager.USERS_COLLECTION).stream()
-        all_user_ids: List[str] = [doc.id for doc in user_docs]
-    except Exception as e:
-        print(f"ERROR: Unable to fetch list of users: {e}")
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
         return
 
-    yesterday_midnight = _get_yesterday_utc()
-    print(f"Processing {len(all_user_ids)} users. Cutoff (yesterday): {yesterday_midnight.date()}")
-
-    for user_id in all_user_ids:
-        # 1. Fetch current stats
-        stats = manager.get_user_stats(user_id)
-        
-        # Flag to track if stats were changed
-        updated_data = {}
-        
-        # We must compare only the date (without time) to check if the task was "yesterday"
-        last_task_date_only = stats.last_task_date.date()
-        yesterday_date_only = yesterday_midnight.date()
-        
-        # Check if the last task was EXACTLY YESTERDAY
-        if last_task_date_only == yesterday_date_only:
-            # The streak was already extended (or it was today's date and will be extended the next day)
-            # We also check that the streak isn't out of date, meaning:
-            # The last task was yesterday, but nothing has been done today (normal).
-            pass # Do not modify the streak because it's current; the task was yesterday.
-        
-        # If the last task was THE DAY BEFORE YESTERDAY or earlier (streak broken)
-        elif last_task_date_only < yesterday_date_only:
-            # Check whether the task was on any day other than yesterday
-            # This means the streak is broken (no task yesterday)
-            if stats.current_streak > 0:
-                print(f"❌ Streak broken for {user_id}. Reset from {stats.current_streak} to 0.")
-                updated_data['current_streak'] = 0
-            
-        # Save changes to Firestore
-        if updated_data:
-            manager.db.collection(manager.STATS_COLLECTION).document(user_id).update(updated_data)
-            print(f"🛠️ Updated stats for {user_id}: {updated_data}")
-            
-    print(f"--- Finished Daily Stats Update ---")
+    cutoff = _get_yesterday_utc()
+    logger.info("Cutoff (yesterday): %s", cutoff.date())
+    DailyStreakResetJob(
+        manager,
+        cutoff,
+        dry_run=dry_run,
+        resume=resume,
+        max_docs_per_second=max_docs_per_second,
+    ).run()
 
 
 if __name__ == "__main__":
     # Run the script (simulate scheduler run)
-    # Requires SERVICE_ACCOUNT_PATH to be set in firestore_manager.py
-    run_daily_update()
\ No newline at end of file
+    # Run from lekturai_back/: python -m app.db_utils.daily_update [--dry-run]
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Reset broken streaks.")
+    parser.add_argument("--dry-run", action="store_true", help="Count the resets without writing.")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the stored checkpoint.")
+    parser.add_argument("--max-docs-per-second", type=float, default=None)
+    args = parser.parse_args()
+    run_daily_update(args.dry_run, not args.no_resume, args.max_docs_per_second)
@@ -0,0 +1,183 @@
+# import_exams.py
+
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.db_utils.batch_jobs import DryRunWriter, LockedWriter
+from app.db_utils.db_service import FirestoreManager
+from app.exam_schemas import Answer as AnswerSchema
+from app.exam_schemas import Exam as ExamSchema
+from app.exam_schemas import Question as QuestionSchema
+from app.logging_config import setup_logging
+from app.text_utils import normalize
+
+logger = logging.getLogger(__name__)
+
+# Files parsed and queued in parallel; BulkWriter parallelizes the sends itself
+DEFAULT_WORKERS = 4
+
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def exam_id_for(path: Path, data: Dict[str, Any]) -> str:
+    """Explicit "exam_id" from the file, otherwise a slug of the file name."""
+    if data.get("exam_id"):
+        return str(data["exam_id"])
+    return re.sub(r"[^a-z0-9]+", "-", normalize(path.stem)).strip("-")
+
+
+def _answer_number(item: Dict[str, Any]) -> int:
+    # extracted_answers.json uses "Zadanie X" rather than raw numbers
+    if "question_number" in item:
+        return int(item["question_number"])
+    match = _NUMBER_RE.search(str(item.get("question", "")))
+    if not match:
+        raise ValueError(f"Answer without question number: {item}")
+    return int(match.group())
+
+
+def load_exam_file(
+    path: Path,
+) -> Tuple[str, ExamSchema, List[QuestionSchema], List[AnswerSchema]]:
+    """
+    Reads one extracted exam, e.g. extracted_tasks.json:
+    {"texts": [...], "tasks": [{"number", "max_points", "question"}, ...],
+     optional "exam_id", "title", "description",
+     optional "answers": [{"question": "Zadanie X" | "question_number", "answer"}]}
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    exam = ExamSchema(
+        title=data.get("title") or path.stem,
+        description=data.get("description"),
+        texts=data.get("texts"),
+        tasks=data.get("tasks"),
+    )
+    questions = [
+        QuestionSchema(number=t["number"], max_points=t["max_points"], text=t["question"])
+        for t in data.get("tasks", [])
+    ]
+    answers = [
+        AnswerSchema(question_number=_answer_number(a), text=a.get("answer") or a["text"])
+        for a in data.get("answers", [])
+    ]
+    return exam_id_for(path, data), exam, questions, answers
+
+
+def _exam_files(source: Path, pattern: str) -> List[Path]:
+    if source.is_file():
+        return [source]
+    return sorted(p for p in source.glob(pattern) if p.is_file())
+
+
+def run_import(
+    source: Path, pattern: str = "*.json", workers: int = DEFAULT_WORKERS, dry_run: bool = False
+) -> None:
+    """
+    Imports every exam file of `source` (a directory or a single file).
+
+    Ids are deterministic (exam id from the file, see exam_id_for), so
+    re-running the import upserts the same documents instead of creating
+    duplicates. All files share one BulkWriter.
+    """
+    mode = " (dry run)" if dry_run else ""
+    logger.info("--- Starting Exam Import%s: %s ---", mode, source)
+
+    files = _exam_files(source, pattern)
+    if not files:
+        logger.info("No exam files matching %s in %s.", pattern, source)
+        return
+
+    try:
+        manager = FirestoreManager()
+    except RuntimeError as e:
+        logger.critical("Unable to initialize FirestoreManager. %s", e)
+        return
+
+    lock = threading.Lock()
+    totals = {"exams": 0, "questions": 0, "answers": 0, "failed_files": 0, "writes": 0, "failed_writes": 0}
+
+    def add(key: str, n: int = 1) -> None:
+        with lock:
+            totals[key] += n
+
+    # DryRunWriter or LockedWriter around a BulkWriter
+    writer: Any
+    if dry_run:
+        writer = DryRunWriter()
+    else:
+        bulk_writer = manager.db.bulk_writer()
+        bulk_writer.on_write_result(lambda ref, result, w: add("writes"))
+
+        def on_error(failure: Any, w: Any) -> bool:
+            if failure.attempts < 5:
+                return True
+            logger.error("Write failed for %s: %s", failure.operation.reference.path, failure.message)
+            add("failed_writes")
+            return False
+
+        bulk_writer.on_write_error(on_error)
+        writer = LockedWriter(bulk_writer)
+
+    def import_file(path: Path) -> Optional[str]:
+        try:
+            exam_id, exam, questions, answers = load_exam_file(path)
+        except Exception as e:
+            logger.error("Error reading %s: %s", path.name, e)
+            add("failed_files")
+            return None
+
+        stored_id = manager.create_exam_with_content(
+            exam, questions, answers, exam_id=exam_id, writer=writer
+        )
+        if stored_id is None:
+            add("failed_files")
+            return None
+
+        add("exams")
+        add("questions", len(questions))
+        add("answers", len(answers))
+        logger.info("Queued %s as %s (%s questions, %s answers)", path.name, stored_id, len(questions), len(answers))
+        return stored_id
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(import_file, files))
+    writer.close()
+    elapsed = max(time.monotonic() - started, 1e-6)
+
+    writes = writer.ops if dry_run else totals["writes"]
+    logger.info(
+        "--- Finished Exam Import%s: %s/%s exams, %s questions, %s answers, "
+        "%s writes (%s failed) in %.1fs = %.1f files/s, %.0f writes/s ---",
+        mode,
+        totals["exams"],
+        len(files),
+        totals["questions"],
+        totals["answers"],
+        writes,
+        totals["failed_writes"],
+        elapsed,
+        len(files) / elapsed,
+        writes / elapsed,
+    )
+
+
+if __name__ == "__main__":
+    # Run from lekturai_back/: python -m app.db_utils.import_exams path/to/exams/
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Import extracted exam JSON files.")
+    parser.add_argument("source", type=Path, help="Directory of exam JSON files or a single file.")
+    parser.add_argument("--pattern", default="*.json")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count writes only.")
+    args = parser.parse_args()
+    run_import(args.source, args.pattern, args.workers, args.dry_run)
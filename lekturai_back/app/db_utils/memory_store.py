@@ -0,0 +1,956 @@
+# memory_store.py
+
+import copy
+import enum
+import random
+import string
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.db_utils.storage import DocumentRef, SnapshotCallback
+from app.import_utils import lazy_module
+
+# Loaded on first use, importing them costs more than the rest of the app
+exceptions = lazy_module("google.api_core.exceptions")
+transforms = lazy_module("google.cloud.firestore_v1.transforms")
+_field_path = lazy_module("google.cloud.firestore_v1.field_path")
+
+# In-memory stand-in for the Firestore client, selected with STORAGE_BACKEND=memory.
+#
+# It implements the part of the client API that FirestoreManager and the
+# maintenance scripts use, with Firestore's semantics, so the same manager
+# code runs against both backends:
+#   - documents: get, set (merge), update (field paths), create, delete,
+#     Increment / ArrayUnion / ArrayRemove / Maximum / Minimum,
+#     DELETE_FIELD, SERVER_TIMESTAMP, last_update_time / exists preconditions
+#   - queries: where (==, !=, <, <=, >, >=, in, not-in, array_contains,
+#     array_contains_any), order_by (implicit inequality and __name__
+#     orders, documents without the field are left out), cursors,
+#     offset, limit, select, count(), collection groups, get_all
+#   - batches, transactions (serialized) and BulkWriter callbacks
+#   - snapshot listeners, called on the writing thread after each commit
+
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+_DESCENDING = "DESCENDING"
+
+# Stored document: (data, create_time, update_time); query row: (reference, *stored)
+_Stored = Tuple[Dict[str, Any], datetime, datetime]
+_Row = Tuple["MemoryDocumentReference", Dict[str, Any], datetime, datetime]
+
+
+def _utc(value: datetime) -> datetime:
+    # Firestore stores naive datetimes as UTC and always returns aware ones
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _copy_in(value: Any) -> Any:
+    """Copies a value that is written, rejecting types Firestore cannot store."""
+    if value is None or isinstance(value, (bool, int, float, str, bytes, MemoryDocumentReference)):
+        return value
+    if isinstance(value, datetime):
+        return _utc(value)
+    if isinstance(value, dict):
+        return {str(k): _copy_in(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy_in(v) for v in value]
+    raise TypeError(f"Cannot convert to a Firestore Value: {value!r} ({type(value).__name__})")
+
+
+def _copy_out(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _copy_out(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_out(v) for v in value]
+    return value
+
+
+def _order_key(value: Any) -> Tuple[Any, ...]:
+    """Sort key following Firestore's ordering of values of mixed types."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, _utc(value))
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, MemoryDocumentReference):
+        return (6, tuple(value.path.split("/")))
+    if isinstance(value, list):
+        return (8, tuple(_order_key(v) for v in value))
+    if isinstance(value, dict):
+        return (9, tuple(sorted((k, _order_key(v)) for k, v in value.items())))
+    raise TypeError(f"Unsupported value in query: {value!r}")
+
+
+def _equal(a: Any, b: Any) -> bool:
+    # 1 == 1.0 as in Firestore, but True != 1
+    key_a, key_b = _order_key(a), _order_key(b)
+    return key_a[0] == key_b[0] and key_a == key_b
+
+
+_MISSING = object()
+
+
+def parse_field_path(path: str) -> List[str]:
+    parts: List[str] = _field_path.parse_field_path(path)
+    return parts
+
+
+def _get_path(data: Dict[str, Any], parts: List[str]) -> Any:
+    node: Any = data
+    for part in parts:
+        if not isinstance(node, dict) or part not in node:
+            return _MISSING
+        node = node[part]
+    return node
+
+
+def _matches(value: Any, op: str, expected: Any) -> bool:
+    if value is _MISSING:
+        return False
+    if op == "==":
+        return _equal(value, expected)
+    if op == "!=":
+        return value is not None and not _equal(value, expected)
+    if op == "in":
+        return any(_equal(value, e) for e in expected)
+    if op == "not-in":
+        return value is not None and not any(_equal(value, e) for e in expected)
+    if op == "array_contains":
+        return isinstance(value, list) and any(_equal(v, expected) for v in value)
+    if op == "array_contains_any":
+        return isinstance(value, list) and any(_equal(v, e) for v in value for e in expected)
+
+    # Range filters only match values of the same type
+    key, bound = _order_key(value), _order_key(expected)
+    if key[0] != bound[0]:
+        return False
+    if op == "<":
+        return key < bound
+    if op == "<=":
+        return key <= bound
+    if op == ">":
+        return key > bound
+    if op == ">=":
+        return key >= bound
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+_INEQUALITY_OPS = {"<", "<=", ">", ">=", "!=", "not-in"}
+
+
+# ---------------------------------
+# WRITES
+# ---------------------------------
+
+
+class _Write:
+    """One pending write: kind is "set", "merge", "update", "create" or "delete"."""
+
+    __slots__ = ("reference", "kind", "data", "option")
+
+    def __init__(self, reference: DocumentRef, kind: str, data: Optional[Dict[str, Any]] = None, option: Any = None) -> None:
+        self.reference = reference
+        self.kind = kind
+        self.data = data
+        self.option = option
+
+
+class _Precondition:
+    def __init__(self, last_update_time: Optional[datetime] = None, exists: Optional[bool] = None) -> None:
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class WriteResult:
+    def __init__(self, update_time: datetime) -> None:
+        self.update_time = update_time
+
+
+def _apply_transform(current: Any, value: Any, now: datetime) -> Any:
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.Maximum):
+        if isinstance(current, (int, float)) and not isinstance(current, bool):
+            return max(current, value.value)
+        return value.value
+    if isinstance(value, transforms.Minimum):
+        if isinstance(current, (int, float)) and not isinstance(current, bool):
+            return min(current, value.value)
+        return value.value
+    if isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            if not any(_equal(v, item) for item in items):
+                items.append(_copy_in(v))
+        return items
+    if isinstance(value, transforms.ArrayRemove):
+        items = list(current) if isinstance(current, list) else []
+        return [item for item in items if not any(_equal(item, v) for v in value.values)]
+    return _copy_in(value)
+
+
+def _set_leaf(node: Dict[str, Any], key: str, value: Any, now: datetime) -> None:
+    if value is transforms.DELETE_FIELD:
+        node.pop(key, None)
+    else:
+        node[key] = _apply_transform(node.get(key), value, now)
+
+
+def _write_fields(target: Dict[str, Any], data: Dict[str, Any], now: datetime) -> None:
+    """set()/set(merge=True): nested maps are merged key by key into target."""
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            child = target.get(key)
+            if not isinstance(child, dict):
+                child = target[key] = {}
+            _write_fields(child, value, now)
+        else:
+            _set_leaf(target, key, value, now)
+
+
+def _update_fields(target: Dict[str, Any], data: Dict[str, Any], now: datetime) -> None:
+    """update(): keys are field paths ("a.b", "a.`2024-01-01`"), values replace whole fields."""
+    for path, value in data.items():
+        parts = parse_field_path(path)
+        node = target
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        _set_leaf(node, parts[-1], value, now)
+
+
+def _apply_write(current: Optional[Dict[str, Any]], write: _Write, now: datetime) -> Optional[Dict[str, Any]]:
+    path = write.reference.path
+    if write.kind == "create" and current is not None:
+        raise exceptions.AlreadyExists(f"Document already exists: {path}")
+    if write.kind == "update" and current is None:
+        raise exceptions.NotFound(f"No document to update: {path}")
+    if write.kind == "delete":
+        return None
+
+    data = write.data or {}
+    if write.kind == "set" or write.kind == "create":
+        new: Dict[str, Any] = {}
+        _write_fields(new, data, now)
+    elif write.kind == "merge":
+        new = copy.deepcopy(current) if current is not None else {}
+        _write_fields(new, data, now)
+    else:
+        new = copy.deepcopy(current or {})
+        _update_fields(new, data, now)
+    return new
+
+
+# ---------------------------------
+# SNAPSHOTS AND REFERENCES
+# ---------------------------------
+
+
+class MemorySnapshot:
+    def __init__(
+        self,
+        reference: DocumentRef,
+        data: Optional[Dict[str, Any]],
+        create_time: Optional[datetime],
+        update_time: Optional[datetime],
+        read_time: datetime,
+    ) -> None:
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return _copy_out(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        value = _get_path(self._data or {}, parse_field_path(field_path))
+        if value is _MISSING:
+            raise KeyError(f"'{field_path}' is not contained in the data")
+        return _copy_out(value)
+
+
+class MemoryQueryDocumentSnapshot(MemorySnapshot):
+    """Query result: the document always exists."""
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = _copy_out(self._data or {})
+        return data
+
+
+def _project(data: Dict[str, Any], field_paths: Optional[List[str]]) -> Dict[str, Any]:
+    if field_paths is None:
+        return data
+    projected: Dict[str, Any] = {}
+    for field in field_paths:
+        parts = parse_field_path(field)
+        value = _get_path(data, parts)
+        if value is _MISSING:
+            continue
+        node = projected
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return projected
+
+
+class MemoryDocumentReference:
+    def __init__(self, client: "MemoryClient", path: str) -> None:
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "MemoryCollectionReference":
+        return MemoryCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id: str) -> "MemoryCollectionReference":
+        return MemoryCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths: Optional[List[str]] = None, transaction: Any = None) -> MemorySnapshot:
+        return self._client._get(self, field_paths)
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> WriteResult:
+        return self._client._commit([_Write(self, "merge" if merge else "set", document_data)])[0]
+
+    def update(self, field_updates: Dict[str, Any], option: Any = None) -> WriteResult:
+        return self._client._commit([_Write(self, "update", field_updates, option)])[0]
+
+    def create(self, document_data: Dict[str, Any]) -> WriteResult:
+        return self._client._commit([_Write(self, "create", document_data)])[0]
+
+    def delete(self, option: Any = None) -> datetime:
+        return self._client._commit([_Write(self, "delete", option=option)])[0].update_time
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self) -> str:
+        return f"<MemoryDocumentReference {self.path}>"
+
+
+# ---------------------------------
+# QUERIES
+# ---------------------------------
+
+
+class _AggregationResult:
+    def __init__(self, alias: str, value: int, read_time: datetime) -> None:
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class _CountQuery:
+    def __init__(self, query: "MemoryQuery", alias: Optional[str]) -> None:
+        self._query = query
+        self._alias = alias or "field_1"
+
+    def get(self, transaction: Any = None) -> List[List[_AggregationResult]]:
+        count, read_time = self._query._count()
+        return [[_AggregationResult(self._alias, count, read_time)]]
+
+    def stream(self, transaction: Any = None) -> Iterator[List[_AggregationResult]]:
+        yield from self.get(transaction)
+
+
+class _QueryPartition:
+    def __init__(self, start_at: Any = None, end_at: Any = None) -> None:
+        self.start_at = start_at
+        self.end_at = end_at
+
+
+class MemoryQuery:
+    def __init__(self, client: "MemoryClient", path: str, all_descendants: bool = False) -> None:
+        self._client = client
+        self._path = path
+        self._all_descendants = all_descendants
+        self._filters: List[Tuple[List[str], str, Any]] = []
+        self._orders: List[Tuple[str, str]] = []
+        self._projection: Optional[List[str]] = None
+        self._offset = 0
+        self._limit: Optional[int] = None
+        # (values or snapshot, "start_at" | "start_after" | "end_at" | "end_before")
+        self._start: Optional[Tuple[Any, str]] = None
+        self._end: Optional[Tuple[Any, str]] = None
+
+    def _copy(self) -> "MemoryQuery":
+        query = copy.copy(self)
+        if type(query) is not MemoryQuery:
+            query.__class__ = MemoryQuery
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        return query
+
+    # --- Builders ---
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, *, filter: Any = None) -> "MemoryQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if field_path is None or op_string is None:
+            raise ValueError("where() needs a field path and an operator.")
+        if op_string in ("in", "not-in", "array_contains_any") and not isinstance(value, (list, tuple)):
+            raise ValueError(f"'{op_string}' needs a list of values.")
+        query = self._copy()
+        query._filters.append((parse_field_path(field_path), op_string, value))
+        return query
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "MemoryQuery":
+        query = self._copy()
+        query._orders.append((field_path, direction))
+        return query
+
+    def select(self, field_paths: Iterable[str]) -> "MemoryQuery":
+        query = self._copy()
+        query._projection = list(field_paths)
+        return query
+
+    def offset(self, num_to_skip: int) -> "MemoryQuery":
+        query = self._copy()
+        query._offset = num_to_skip
+        return query
+
+    def limit(self, count: int) -> "MemoryQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def _cursor(self, which: str, cursor: Any) -> "MemoryQuery":
+        query = self._copy()
+        if which.startswith("start"):
+            query._start = (cursor, which)
+        else:
+            query._end = (cursor, which)
+        return query
+
+    def start_at(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._cursor("start_at", document_fields_or_snapshot)
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._cursor("start_after", document_fields_or_snapshot)
+
+    def end_at(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._cursor("end_at", document_fields_or_snapshot)
+
+    def end_before(self, document_fields_or_snapshot: Any) -> "MemoryQuery":
+        return self._cursor("end_before", document_fields_or_snapshot)
+
+    def count(self, alias: Optional[str] = None) -> _CountQuery:
+        return _CountQuery(self, alias)
+
+    def on_snapshot(self, callback: SnapshotCallback) -> "_Watch":
+        return self._client._watch(self, callback)
+
+    # --- Execution ---
+
+    def stream(self, transaction: Any = None) -> Iterator[MemoryQueryDocumentSnapshot]:
+        yield from self.get(transaction)
+
+    def get(self, transaction: Any = None) -> List[MemoryQueryDocumentSnapshot]:
+        snapshots, _ = self._snapshots()
+        self._client._count_reads(max(len(snapshots), 1))
+        return snapshots
+
+    def _snapshots(self) -> Tuple[List[MemoryQueryDocumentSnapshot], datetime]:
+        rows, read_time = self._rows()
+        snapshots = [
+            MemoryQueryDocumentSnapshot(ref, _copy_out(_project(data, self._projection)), created, updated, read_time)
+            for ref, data, created, updated in rows
+        ]
+        return snapshots, read_time
+
+    def _count(self) -> Tuple[int, datetime]:
+        rows, read_time = self._rows()
+        self._client._count_reads(max(len(rows) // 1000, 1))
+        return len(rows), read_time
+
+    def _normalized_orders(self) -> List[Tuple[str, str]]:
+        """Explicit orders, then inequality fields, then __name__ (as Firestore does)."""
+        orders = list(self._orders)
+        ordered = {field for field, _ in orders}
+        inequality_fields = sorted(
+            {".".join(parts) for parts, op, _ in self._filters if op in _INEQUALITY_OPS} - ordered
+        )
+        last_direction = orders[-1][1] if orders else "ASCENDING"
+        orders.extend((field, last_direction) for field in inequality_fields)
+        if "__name__" not in ordered:
+            orders.append(("__name__", last_direction))
+        return orders
+
+    def _cursor_values(self, cursor: Any, orders: List[Tuple[str, str]]) -> List[Any]:
+        if isinstance(cursor, MemorySnapshot):
+            values = [
+                cursor.reference if field == "__name__" else _get_path(cursor._data or {}, parse_field_path(field))
+                for field, _ in orders
+            ]
+        elif isinstance(cursor, dict):
+            values = []
+            for field, _ in orders:
+                if field not in cursor:
+                    break
+                values.append(cursor[field])
+        else:
+            values = list(cursor)
+
+        if len(values) > len(orders):
+            raise ValueError("Too many cursor values for the query's orders.")
+        for i, (field, _) in enumerate(orders[: len(values)]):
+            if field == "__name__" and isinstance(values[i], str):
+                values[i] = self._client.document(f"{self._path}/{values[i]}")
+        return values
+
+    def _rows(self) -> Tuple[List[_Row], datetime]:
+        orders = self._normalized_orders()
+        order_parts = [(None if f == "__name__" else parse_field_path(f), d == _DESCENDING) for f, d in orders]
+
+        with self._client._lock:
+            read_time = self._client._read_time()
+            rows: List[Tuple[List[Tuple[Any, ...]], _Row]] = []
+            for ref, stored in self._client._candidates(self._path, self._all_descendants):
+                data = stored[0]
+                if not all(_matches(_get_path(data, parts), op, value) for parts, op, value in self._filters):
+                    continue
+                keys: List[Tuple[Any, ...]] = []
+                for parts, _ in order_parts:
+                    value = ref if parts is None else _get_path(data, parts)
+                    if value is _MISSING:
+                        break
+                    keys.append(_order_key(value))
+                else:
+                    rows.append((keys, (ref, data, stored[1], stored[2])))
+
+        # Stable sorts from the last order to the first
+        for i in reversed(range(len(order_parts))):
+            rows.sort(key=lambda row: row[0][i], reverse=order_parts[i][1])
+
+        for cursor in (self._start, self._end):
+            if cursor is None:
+                continue
+            values, which = cursor
+            bound = [_order_key(v) for v in self._cursor_values(values, orders)]
+            rows = [row for row in rows if self._passes(row[0], bound, order_parts, which)]
+
+        result = [row for _, row in rows[self._offset:]]
+        if self._limit is not None:
+            result = result[: self._limit]
+        return result, read_time
+
+    @staticmethod
+    def _passes(
+        keys: List[Tuple[Any, ...]],
+        bound: List[Tuple[Any, ...]],
+        order_parts: List[Tuple[Optional[List[str]], bool]],
+        which: str,
+    ) -> bool:
+        cmp = 0
+        for i, value in enumerate(bound):
+            if keys[i] != value:
+                cmp = 1 if keys[i] > value else -1
+                if order_parts[i][1]:
+                    cmp = -cmp
+                break
+        if which == "start_at":
+            return cmp >= 0
+        if which == "start_after":
+            return cmp > 0
+        if which == "end_at":
+            return cmp <= 0
+        return cmp < 0
+
+
+class MemoryCollectionReference(MemoryQuery):
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> Optional[MemoryDocumentReference]:
+        if "/" not in self._path:
+            return None
+        return MemoryDocumentReference(self._client, self._path.rsplit("/", 1)[0])
+
+    def document(self, document_id: Optional[str] = None) -> MemoryDocumentReference:
+        if document_id is None:
+            document_id = "".join(random.choices(_AUTO_ID_CHARS, k=20))
+        return MemoryDocumentReference(self._client, f"{self._path}/{document_id}")
+
+    def add(self, document_data: Dict[str, Any], document_id: Optional[str] = None) -> Tuple[datetime, MemoryDocumentReference]:
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self, page_size: Optional[int] = None) -> Iterator[MemoryDocumentReference]:
+        # Like Firestore, this includes "missing" documents that only hold subcollections
+        return iter(self._client._document_refs(self._path))
+
+
+class MemoryCollectionGroup(MemoryQuery):
+    def get_partitions(self, partition_count: int) -> Iterator[_QueryPartition]:
+        # One process, one partition: the whole group
+        yield _QueryPartition()
+
+
+# ---------------------------------
+# SNAPSHOT LISTENERS
+# ---------------------------------
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, type: ChangeType, document: MemorySnapshot, old_index: int, new_index: int) -> None:
+        self.type = type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class _Watch:
+    """
+    Listener of one query. Like Firestore it is called once with the current
+    documents (all ADDED), then after every commit that changes the results.
+    """
+
+    def __init__(self, query: MemoryQuery, callback: SnapshotCallback) -> None:
+        self._query = query
+        self._callback = callback
+        self._docs: List[MemoryQueryDocumentSnapshot] = []
+        self._started = False
+
+    def _refresh(self) -> None:
+        # Called with the store lock held
+        docs, read_time = self._query._snapshots()
+        old = {doc.reference.path: (i, doc) for i, doc in enumerate(self._docs)}
+        new = {doc.reference.path for doc in docs}
+        changes = [
+            DocumentChange(ChangeType.REMOVED, doc, i, -1) for path, (i, doc) in old.items() if path not in new
+        ]
+        for i, doc in enumerate(docs):
+            previous = old.get(doc.reference.path)
+            if previous is None:
+                changes.append(DocumentChange(ChangeType.ADDED, doc, -1, i))
+            elif previous[1].update_time != doc.update_time:
+                changes.append(DocumentChange(ChangeType.MODIFIED, doc, previous[0], i))
+        if not changes and self._started:
+            return
+
+        self._docs = docs
+        self._started = True
+        # Listeners are billed one read per changed document
+        self._query._client.reads += len(changes)
+        self._callback(docs, changes, read_time)
+
+    def unsubscribe(self) -> None:
+        self._query._client._unwatch(self)
+
+
+# ---------------------------------
+# BATCHES, TRANSACTIONS, BULK WRITER
+# ---------------------------------
+
+
+class MemoryWriteBatch:
+    def __init__(self, client: "MemoryClient") -> None:
+        self._client = client
+        self._writes: List[_Write] = []
+
+    def set(self, reference: DocumentRef, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(_Write(reference, "merge" if merge else "set", document_data))
+
+    def update(self, reference: DocumentRef, field_updates: Dict[str, Any], option: Any = None) -> None:
+        self._writes.append(_Write(reference, "update", field_updates, option))
+
+    def create(self, reference: DocumentRef, document_data: Dict[str, Any]) -> None:
+        self._writes.append(_Write(reference, "create", document_data))
+
+    def delete(self, reference: DocumentRef, option: Any = None) -> None:
+        self._writes.append(_Write(reference, "delete", option=option))
+
+    def commit(self, **kwargs: Any) -> List[WriteResult]:
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Reads see committed data, writes are buffered and committed together.
+    Transactions are serialized on the store lock, so they never conflict
+    and are never retried.
+    """
+
+    def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._client._lock:
+            self._writes = []
+            result = func(self, *args, **kwargs)
+            self.commit()
+            return result
+
+
+class _BulkWriteFailure:
+    def __init__(self, operation: _Write, error: Exception, attempts: int) -> None:
+        self.operation = operation
+        # google.rpc.Code number, as in the real BulkWriteFailure (9 = FAILED_PRECONDITION)
+        status = getattr(error, "grpc_status_code", None)
+        self.code = status.value[0] if status is not None else None
+        self.message = str(error)
+        self.attempts = attempts
+
+
+class MemoryBulkWriter(MemoryWriteBatch):
+    """BulkWriter: each write is applied on its own, failures go to on_write_error."""
+
+    MAX_ATTEMPTS = 10
+
+    def __init__(self, client: "MemoryClient") -> None:
+        super().__init__(client)
+        self._on_result: Optional[Callable[[Any, Any, Any], None]] = None
+        self._on_error: Optional[Callable[[Any, Any], bool]] = None
+
+    def on_write_result(self, callback: Callable[[Any, Any, Any], None]) -> None:
+        self._on_result = callback
+
+    def on_write_error(self, callback: Callable[[Any, Any], bool]) -> None:
+        self._on_error = callback
+
+    def flush(self) -> None:
+        writes, self._writes = self._writes, []
+        for write in writes:
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    result = self._client._commit([write])[0]
+                except Exception as e:
+                    failure = _BulkWriteFailure(write, e, attempts)
+                    retry = self._on_error(failure, self) if self._on_error else attempts < self.MAX_ATTEMPTS
+                    if retry and attempts < self.MAX_ATTEMPTS:
+                        continue
+                    break
+                if self._on_result:
+                    self._on_result(write.reference, result, self)
+                break
+
+    def close(self) -> None:
+        self.flush()
+
+
+# ---------------------------------
+# CLIENT
+# ---------------------------------
+
+
+class MemoryClient:
+    """
+    Process-local document store with the Firestore client interface.
+    Documents are kept per collection path: {collection path: {doc id: (data, create_time, update_time)}}.
+    """
+
+    def __init__(self) -> None:
+        self._collections: Dict[str, Dict[str, _Stored]] = {}
+        self._lock = threading.RLock()
+        self._last_time = datetime.now(timezone.utc)
+        # Counters for profiling (billed-like units: documents read / written)
+        self.reads = 0
+        self.writes = 0
+        # Called with the reads of every get / query / count (per-request counts)
+        self.on_reads: Optional[Callable[[int], None]] = None
+        self._watches: List[_Watch] = []
+
+    # --- Client interface ---
+
+    def collection(self, *path: str) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self, "/".join(path))
+
+    def document(self, *path: str) -> MemoryDocumentReference:
+        return MemoryDocumentReference(self, "/".join(path))
+
+    def collection_group(self, collection_id: str) -> MemoryCollectionGroup:
+        return MemoryCollectionGroup(self, collection_id, all_descendants=True)
+
+    def get_all(self, references: Iterable[DocumentRef], field_paths: Optional[List[str]] = None, transaction: Any = None) -> Iterator[MemorySnapshot]:
+        refs = list({ref.path: ref for ref in references}.values())
+        with self._lock:
+            snapshots = [self._get(ref, field_paths) for ref in refs]
+        yield from snapshots
+
+    def batch(self) -> MemoryWriteBatch:
+        return MemoryWriteBatch(self)
+
+    def transaction(self, **kwargs: Any) -> MemoryTransaction:
+        return MemoryTransaction(self)
+
+    def bulk_writer(self, **kwargs: Any) -> MemoryBulkWriter:
+        return MemoryBulkWriter(self)
+
+    def write_option(self, **kwargs: Any) -> _Precondition:
+        """last_update_time= or exists= precondition for update() / delete()."""
+        return _Precondition(**kwargs)
+
+    def load_documents(self, documents: Dict[str, Dict[str, Any]]) -> None:
+        """Seeds the store: {"users/u1": {...}, "user-all-time-stats/u1/history/h1": {...}}."""
+        self._commit([_Write(self.document(path), "set", data) for path, data in documents.items()])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._collections.clear()
+
+    # --- Internals ---
+
+    def _watch(self, query: MemoryQuery, callback: SnapshotCallback) -> _Watch:
+        watch = _Watch(query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            watch._refresh()
+        return watch
+
+    def _unwatch(self, watch: _Watch) -> None:
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self) -> None:
+        # Firestore calls listeners on its own thread, here they run on the writing one
+        with self._lock:
+            for watch in list(self._watches):
+                watch._refresh()
+
+    def _count_reads(self, n: int) -> None:
+        with self._lock:
+            self.reads += n
+        if self.on_reads is not None:
+            self.on_reads(n)
+
+    def _read_time(self) -> datetime:
+        return self._last_time
+
+    def _commit_time(self) -> datetime:
+        # Strictly increasing, so update_time preconditions can tell writes apart
+        now = datetime.now(timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _split(self, path: str) -> Tuple[str, str]:
+        collection, _, doc_id = path.rpartition("/")
+        if not collection or path.count("/") % 2 != 1:
+            raise ValueError(f"Not a document path: {path}")
+        return collection, doc_id
+
+    def _get(self, ref: DocumentRef, field_paths: Optional[List[str]]) -> MemorySnapshot:
+        collection, doc_id = self._split(ref.path)
+        with self._lock:
+            stored = self._collections.get(collection, {}).get(doc_id)
+            read_time = self._read_time()
+        self._count_reads(1)
+        if stored is None:
+            return MemorySnapshot(ref, None, None, None, read_time)
+        data = _copy_out(_project(stored[0], field_paths))
+        return MemorySnapshot(ref, data, stored[1], stored[2], read_time)
+
+    def _candidates(self, path: str, all_descendants: bool) -> Iterator[Tuple[MemoryDocumentReference, _Stored]]:
+        # Called with self._lock held
+        if not all_descendants:
+            paths = [path] if path in self._collections else []
+        else:
+            paths = [p for p in self._collections if p.rsplit("/", 1)[-1] == path]
+        for collection in paths:
+            for doc_id, stored in self._collections[collection].items():
+                yield MemoryDocumentReference(self, f"{collection}/{doc_id}"), stored
+
+    def _document_refs(self, collection: str) -> List[MemoryDocumentReference]:
+        with self._lock:
+            ids = dict.fromkeys(self._collections.get(collection, {}))
+            prefix = collection + "/"
+            for path in self._collections:
+                if path.startswith(prefix) and self._collections[path]:
+                    ids[path[len(prefix):].split("/", 1)[0]] = None
+        return [MemoryDocumentReference(self, f"{collection}/{doc_id}") for doc_id in ids]
+
+    def _commit(self, writes: List[_Write]) -> List[WriteResult]:
+        """Applies the writes atomically: all of them or, on any error, none."""
+        with self._lock:
+            now = self._commit_time()
+            staged: Dict[str, Optional[_Stored]] = {}
+            for write in writes:
+                collection, doc_id = self._split(write.reference.path)
+                path = write.reference.path
+                stored = staged[path] if path in staged else self._collections.get(collection, {}).get(doc_id)
+
+                option = write.option
+                if option is not None:
+                    if option.exists is not None and option.exists != (stored is not None):
+                        raise exceptions.FailedPrecondition(f"Precondition failed (exists) for {path}")
+                    if option.last_update_time is not None and (
+                        stored is None or stored[2] != option.last_update_time
+                    ):
+                        raise exceptions.FailedPrecondition(f"Precondition failed (update_time) for {path}")
+
+                data = _apply_write(stored[0] if stored is not None else None, write, now)
+                if data is None:
+                    staged[path] = None
+                else:
+                    staged[path] = (data, stored[1] if stored is not None else now, now)
+
+            for path, stored in staged.items():
+                collection, doc_id = self._split(path)
+                docs = self._collections.setdefault(collection, {})
+                if stored is None:
+                    docs.pop(doc_id, None)
+                    if not docs:
+                        del self._collections[collection]
+                else:
+                    docs[doc_id] = stored
+            self.writes += len(writes)
+            if self._watches:
+                self._notify()
+        return [WriteResult(now) for _ in writes]
+
+
+_default_client: Optional[MemoryClient] = None
+_default_client_lock = threading.Lock()
+
+
+def memory_client() -> MemoryClient:
+    """The process-wide store (every FirestoreManager of the process shares it)."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = MemoryClient()
+        return _default_client
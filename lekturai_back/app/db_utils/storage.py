@@ -0,0 +1,190 @@
+# storage.py
+
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+# The storage interface FirestoreManager and the maintenance scripts code against:
+# the part of the Firestore client API they use. firestore.Client implements it
+# as is, MemoryClient (memory_store.py) implements it for STORAGE_BACKEND=memory.
+# Both are structural matches, nothing subclasses these protocols.
+
+# on_snapshot callback: (documents, changes, read_time)
+SnapshotCallback = Callable[[Any, Any, Any], None]
+
+
+class Snapshot(Protocol):
+    @property
+    def id(self) -> str: ...
+
+    @property
+    def reference(self) -> "DocumentRef": ...
+
+    @property
+    def exists(self) -> bool: ...
+
+    @property
+    def create_time(self) -> Optional[datetime]: ...
+
+    @property
+    def update_time(self) -> Optional[datetime]: ...
+
+    def to_dict(self) -> Optional[Dict[str, Any]]: ...
+
+    def get(self, field_path: str) -> Any: ...
+
+
+class QueryDocumentSnapshot(Snapshot, Protocol):
+    # Query results always exist
+    def to_dict(self) -> Dict[str, Any]: ...
+
+
+class DocumentRef(Protocol):
+    @property
+    def id(self) -> str: ...
+
+    @property
+    def path(self) -> str: ...
+
+    @property
+    def parent(self) -> "CollectionRef": ...
+
+    def collection(self, collection_id: str) -> "CollectionRef": ...
+
+    def get(self, field_paths: Optional[List[str]] = None, transaction: Any = None) -> Snapshot: ...
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> Any: ...
+
+    def update(self, field_updates: Dict[str, Any], option: Any = None) -> Any: ...
+
+    def create(self, document_data: Dict[str, Any]) -> Any: ...
+
+    def delete(self, option: Any = None) -> Any: ...
+
+
+class AggregationResult(Protocol):
+    @property
+    def alias(self) -> str: ...
+
+    @property
+    def value(self) -> int: ...
+
+
+class CountQuery(Protocol):
+    def get(self, transaction: Any = None) -> Sequence[Sequence[AggregationResult]]: ...
+
+
+class Watch(Protocol):
+    def unsubscribe(self) -> None: ...
+
+
+class Query(Protocol):
+    def where(
+        self,
+        field_path: Optional[str] = None,
+        op_string: Optional[str] = None,
+        value: Any = None,
+        *,
+        filter: Any = None,
+    ) -> "Query": ...
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "Query": ...
+
+    def select(self, field_paths: Iterable[str]) -> "Query": ...
+
+    def offset(self, num_to_skip: int) -> "Query": ...
+
+    def limit(self, count: int) -> "Query": ...
+
+    # Cursors take a snapshot, a {field: value} dict or a list of values
+    def start_at(self, document_fields_or_snapshot: Any) -> "Query": ...
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "Query": ...
+
+    def end_at(self, document_fields_or_snapshot: Any) -> "Query": ...
+
+    def end_before(self, document_fields_or_snapshot: Any) -> "Query": ...
+
+    def count(self, alias: Optional[str] = None) -> CountQuery: ...
+
+    def stream(self, transaction: Any = None) -> Iterator[QueryDocumentSnapshot]: ...
+
+    def get(self, transaction: Any = None) -> Sequence[QueryDocumentSnapshot]: ...
+
+    def on_snapshot(self, callback: SnapshotCallback) -> Watch: ...
+
+
+class CollectionRef(Query, Protocol):
+    @property
+    def id(self) -> str: ...
+
+    # None for root collections
+    @property
+    def parent(self) -> Optional[DocumentRef]: ...
+
+    def document(self, document_id: Optional[str] = None) -> DocumentRef: ...
+
+    def add(self, document_data: Dict[str, Any], document_id: Optional[str] = None) -> Tuple[Any, DocumentRef]: ...
+
+    def list_documents(self, page_size: Optional[int] = None) -> Iterator[DocumentRef]: ...
+
+
+class QueryPartition(Protocol):
+    @property
+    def start_at(self) -> Any: ...
+
+    @property
+    def end_at(self) -> Any: ...
+
+
+class CollectionGroup(Query, Protocol):
+    def get_partitions(self, partition_count: int) -> Iterator[QueryPartition]: ...
+
+
+class Writes(Protocol):
+    def set(self, reference: DocumentRef, document_data: Dict[str, Any], merge: bool = False) -> Any: ...
+
+    def update(self, reference: DocumentRef, field_updates: Dict[str, Any], option: Any = None) -> Any: ...
+
+    def create(self, reference: DocumentRef, document_data: Dict[str, Any]) -> Any: ...
+
+    def delete(self, reference: DocumentRef, option: Any = None) -> Any: ...
+
+
+class WriteBatch(Writes, Protocol):
+    def commit(self) -> Any: ...
+
+
+class BulkWriter(Writes, Protocol):
+    # callback(reference, write_result, bulk_writer)
+    def on_write_result(self, callback: Callable[[Any, Any, Any], None]) -> None: ...
+
+    # callback(failure, bulk_writer) -> retry?
+    def on_write_error(self, callback: Callable[[Any, Any], bool]) -> None: ...
+
+    def flush(self) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class StorageClient(Protocol):
+    def collection(self, *collection_path: str) -> CollectionRef: ...
+
+    def document(self, *document_path: str) -> DocumentRef: ...
+
+    def collection_group(self, collection_id: str) -> CollectionGroup: ...
+
+    def get_all(
+        self,
+        references: Iterable[DocumentRef],
+        field_paths: Optional[List[str]] = None,
+        transaction: Any = None,
+    ) -> Iterator[Snapshot]: ...
+
+    def batch(self) -> WriteBatch: ...
+
+    # Run with backend.transactional, which handles both clients
+    def transaction(self, **kwargs: Any) -> Any: ...
+
+    def bulk_writer(self, **kwargs: Any) -> BulkWriter: ...
+
+    def write_option(self, **kwargs: Any) -> Any: ...
@@ -0,0 +1,278 @@
+# write_behind.py
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.import_utils import lazy_module
+
+logger = logging.getLogger(__name__)
+
+firestore = lazy_module("firebase_admin.firestore")
+
+
+# Pending increments of one document: field path -> amount
+_Fields = Dict[Tuple[str, ...], float]
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces Increment writes per document and sends them in the background.
+
+    set(ref, {"a": {"b": Increment(2)}}, merge=True) has the same effect as
+    the direct write, but it only adds 2 to a pending counter. Every
+    `window_seconds` all pending documents are written once through a
+    BulkWriter, so 50 gradings of one school in a window become one write per
+    touched document. Only Increments can be buffered.
+
+    Memory is bounded: when more than `max_pending_docs` documents are
+    pending, the caller flushes synchronously. The flush thread starts with
+    the first write; close() flushes what is left (call it on shutdown).
+    Increments whose write fails go back into the buffer for the next flush.
+    """
+
+    def __init__(self, db: Any, window_seconds: float = 1.0, max_pending_docs: int = 5000):
+        self._db = db
+        self.window_seconds = window_seconds
+        self.max_pending_docs = max_pending_docs
+
+        # path -> (ref, {field path tuple: amount}, time of the first pending increment)
+        self._pending: Dict[str, Tuple[Any, _Fields, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.increments_received = 0
+        self.docs_written = 0
+        self.failed_writes = 0
+        self.flushes = 0
+        self.last_flush_lag_s = 0.0
+        self.max_flush_lag_s = 0.0
+
+    # --- Writer interface (see FirestoreManager.add_group_stats_delta) ---
+
+    def set(self, ref: Any, data: Dict[str, Any], merge: bool = False) -> None:
+        if not merge:
+            raise ValueError("WriteBehindBuffer only supports merge writes of Increments.")
+
+        increments: _Fields = {}
+        self._collect(data, (), increments)
+
+        with self._lock:
+            self._add(ref, increments, time.monotonic())
+            self.increments_received += 1
+            over_limit = len(self._pending) > self.max_pending_docs
+            if self._thread is None and not self._stop.is_set():
+                self._start()
+
+        if over_limit:
+            self.flush()
+
+    def _add(self, ref: Any, increments: _Fields, first_at: float) -> None:
+        # Called with self._lock held
+        _, fields, pending_since = self._pending.get(ref.path, (ref, {}, first_at))
+        for field, amount in increments.items():
+            fields[field] = fields.get(field, 0) + amount
+        self._pending[ref.path] = (ref, fields, min(pending_since, first_at))
+
+    def _collect(self, data: Dict[str, Any], prefix: Tuple[str, ...], out: _Fields) -> None:
+        for key, value in data.items():
+            path = prefix + (key,)
+            if isinstance(value, dict):
+                self._collect(value, path, out)
+            elif isinstance(value, firestore.Increment):
+                out[path] = out.get(path, 0) + value.value
+            else:
+                raise ValueError(f"Only Increment values can be buffered ({'.'.join(path)}).")
+
+    # --- Flushing ---
+
+    def _start(self) -> None:
+        # Called with self._lock held
+        self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.window_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Error flushing write-behind buffer: %s", e)
+
+    def _requeue(self, pending: Dict[str, Tuple[Any, _Fields, float]]) -> None:
+        """Puts unwritten increments back, merged with the ones added meanwhile."""
+        with self._lock:
+            for ref, fields, first_at in pending.values():
+                self._add(ref, fields, first_at)
+
+    def flush(self) -> int:
+        """
+        Writes all pending documents; returns how many were written.
+        When the BulkWriter fails, or a write still fails after its retries,
+        the increments are put back and the next flush sends them again.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            failed: Dict[str, Tuple[Any, _Fields, float]] = {}
+
+            def on_error(failure: Any, w: Any) -> bool:
+                if failure.attempts < 5:
+                    return True
+                path = failure.operation.reference.path
+                with self._lock:
+                    self.failed_writes += 1
+                    failed[path] = pending[path]
+                logger.error("Write-behind write failed for %s: %s", path, failure.message)
+                return False
+
+            oldest = min(first_at for _, _, first_at in pending.values())
+            try:
+                writer = self._db.bulk_writer()
+                writer.on_write_error(on_error)
+                for ref, fields, _ in pending.values():
+                    writer.set(ref, self._nested(fields), merge=True)
+                writer.close()
+            except Exception:
+                self._requeue(pending)
+                raise
+            if failed:
+                self._requeue(failed)
+
+            written = len(pending) - len(failed)
+            lag = time.monotonic() - oldest
+            with self._lock:
+                self.flushes += 1
+                self.docs_written += written
+                self.last_flush_lag_s = lag
+                self.max_flush_lag_s = max(self.max_flush_lag_s, lag)
+            return written
+
+    @staticmethod
+    def _nested(fields: _Fields) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for path, amount in fields.items():
+            node = data
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = firestore.Increment(amount)
+        return data
+
+    def close(self) -> None:
+        """Stops the background thread and flushes what is left."""
+        self._stop.set()
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_docs": len(self._pending),
+                "increments_received": self.increments_received,
+                "docs_written": self.docs_written,
+                "failed_writes": self.failed_writes,
+                # Increments per written document (1.0 = nothing was coalesced)
+                "coalescing_ratio": (
+                    round(self.increments_received / self.docs_written, 2) if self.docs_written else None
+                ),
+                "flushes": self.flushes,
+                "last_flush_lag_s": round(self.last_flush_lag_s, 3),
+                "max_flush_lag_s": round(self.max_flush_lag_s, 3),
+            }
+
+
+class LeaderboardBuffer:
+    """
+    Coalesces leaderboard updates per school/class board.
+
+    A board is a single document, so updating it in its own transaction on
+    every grading makes it as contended as the unsharded counters were.
+    update() only records the user's latest entry (None removes the user);
+    every `window_seconds` each touched board is updated once with all of
+    its pending entries through `apply(group_id, {user_id: entry})`.
+
+    A board whose update fails keeps its entries for the next flush (newer
+    updates of the same users win) and is handed to `on_failure(group_id,
+    error)`, which records it for backfill_group_stats.py --repair in case
+    the process stops first. close() flushes what is left (call it on
+    shutdown).
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[str, Dict[str, Optional[Dict[str, Any]]]], None],
+        on_failure: Callable[[str, Exception], None],
+        window_seconds: float = 1.0,
+    ) -> None:
+        self._apply = apply
+        self._on_failure = on_failure
+        self.window_seconds = window_seconds
+
+        # group id -> {user id: latest entry, None = remove}
+        self._pending: Dict[str, Dict[str, Optional[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.updates_received = 0
+        self.boards_written = 0
+        self.failed_boards = 0
+
+    def update(self, group_id: str, user_id: str, entry: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._pending.setdefault(group_id, {})[user_id] = entry
+            self.updates_received += 1
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._flush_loop, name="leaderboards", daemon=True)
+                self._thread.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.window_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Error flushing leaderboard buffer: %s", e)
+
+    def flush(self) -> int:
+        """Updates all boards with pending entries; returns how many were updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            written = failed = 0
+            for group_id, updates in pending.items():
+                try:
+                    self._apply(group_id, updates)
+                    written += 1
+                except Exception as e:
+                    failed += 1
+                    with self._lock:
+                        newer = self._pending.get(group_id, {})
+                        self._pending[group_id] = {**updates, **newer}
+                    self._on_failure(group_id, e)
+
+            with self._lock:
+                self.boards_written += written
+                self.failed_boards += failed
+            return written
+
+    def close(self) -> None:
+        """Stops the background thread and flushes what is left."""
+        self._stop.set()
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_boards": len(self._pending),
+                "updates_received": self.updates_received,
+                "boards_written": self.boards_written,
+                "failed_boards": self.failed_boards,
+            }
@@ -0,0 +1,31 @@
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """
+    Module placeholder that imports the real module on first attribute access.
+
+    firebase_admin, google.cloud.firestore and google.genai take most of the
+    server's import time; with `firestore = lazy_module("firebase_admin.firestore")`
+    code keeps writing `firestore.Increment(...)`, but the import happens when
+    the first request (or the warm-up) needs it.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name: str) -> Any:
+    return LazyModule(name)
@@ -0,0 +1,200 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Logging pipeline of the API and the maintenance scripts:
+#
+#   logger.info(...) -> SamplingFilter -> DroppingQueueHandler -> queue
+#                    -> QueueListener thread -> StreamHandler(stderr, JSON)
+#
+# The calling thread only samples and enqueues; formatting and writing
+# happen on the listener thread, so a slow stderr (or log collector) never
+# adds to request latency. Configuration (env):
+#   LOG_LEVEL=INFO                          root level
+#   LOG_LEVELS=app.db_utils=DEBUG,uvicorn.access=WARNING   per-module levels
+#   LOG_FORMAT=json | text                  text is easier to read in a terminal
+#   LOG_SAMPLE_INITIAL=100, LOG_SAMPLE_THEREAFTER=100      see SamplingFilter
+#   LOG_QUEUE_SIZE=10000                    records waiting to be written
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, extra fields, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # Fields passed with logger.info(..., extra={"user_id": ...})
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Limits repeated messages. For each (logger, level, message template),
+    the first `initial` records of every `period` seconds pass; after that
+    only every `thereafter`-th does. The next record that passes carries
+    the number of dropped ones in `sampled_out`. CRITICAL is never dropped.
+
+    The key is the template, not the formatted text, so log with arguments
+    (logger.error("Error reading stats: %s", e)) rather than f-strings.
+    """
+
+    MAX_KEYS = 10_000
+
+    def __init__(self, initial: int, thereafter: int, period: float = 1.0):
+        super().__init__()
+        self.initial = initial
+        self.thereafter = max(thereafter, 1)
+        self.period = period
+        # key -> [window start, records in window, dropped since the last passed record]
+        self._counters: Dict[Tuple[str, int, Any], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.initial <= 0 or record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.period:
+                if counter is None and len(self._counters) >= self.MAX_KEYS:
+                    self._counters.clear()
+                dropped = counter[2] if counter is not None else 0
+                counter = self._counters[key] = [now, 0, dropped]
+            counter[1] += 1
+            n = counter[1]
+            if n > self.initial and (n - self.initial) % self.thereafter:
+                counter[2] += 1
+                return False
+            dropped, counter[2] = counter[2], 0
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted."""
+
+    def __init__(self, log_queue: "queue.Queue[Any]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now (they may change later); the traceback is kept
+        # apart from the message so the listener can put it in its own field
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.dropped:
+            record.queue_dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.dropped = 0
+
+
+class _Listener(logging.handlers.QueueListener):
+    def __init__(
+        self, log_queue: "queue.Queue[Any]", *handlers: logging.Handler, respect_handler_level: bool = False
+    ) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self._log_queue = log_queue
+
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full on shutdown; wait for the thread to make room
+        # (None is QueueListener's sentinel)
+        self._log_queue.put(None)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def _module_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(fmt: Optional[str] = None) -> None:
+    """Routes all loggers (uvicorn's included) through the queue; safe to call more than once."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        fmt = (fmt or os.getenv("LOG_FORMAT") or "json").lower()
+        stream = logging.StreamHandler(sys.stderr)
+        if fmt == "json":
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        log_queue: "queue.Queue[Any]" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(
+            SamplingFilter(
+                initial=int(os.getenv("LOG_SAMPLE_INITIAL", "100")),
+                thereafter=int(os.getenv("LOG_SAMPLE_THEREAFTER", "100")),
+            )
+        )
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+        # uvicorn installs its own (synchronous) handlers; send its records to ours
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+        for name, level in _module_levels(os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = _Listener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Writes the records still in the queue and stops the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -1,9 +1,66 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import anyio.to_thread
+from fastapi import FastAPI, Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.db_utils import db_manager, db_manager_initialized, get_db_manager
+from app.logging_config import setup_logging
 from app.routers import history, exercises, schools, chat, search, stats
+from app.services.ai_service import get_ai_service
+from app.services.sapling_service import get_sapling_service
+from app.services.school_catalog import school_catalog
+from app.services.warmup import Warmup
 from fastapi.middleware.cors import CORSMiddleware
 
+# JSON logs written by a background thread (see app.logging_config)
+setup_logging()
+
+# Heavy clients are built here, after the server has started listening (see /ready)
+# The first request to a fresh worker should not pay for credentials, the gRPC
+# channel, TLS handshakes or empty caches.
+warmup = Warmup(
+    [
+        ("firestore", get_db_manager),
+        ("firestore_channel", lambda: get_db_manager().check_connection()),
+        ("stats_invalidation", lambda: get_db_manager().start_stats_invalidation_listener()),
+        # School/city autocomplete is served from memory, refreshed in the background
+        ("school_catalog", school_catalog.start),
+        ("exam_bank", lambda: get_db_manager().preload_exam_bank()),
+        # Best effort: an unreachable provider is logged, it does not block readiness
+        ("gemini", lambda: get_ai_service().warm_up()),
+        ("sapling", lambda: get_sapling_service().warm_up()),
+    ]
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Threads for the sync endpoints (they block on Firestore and the AI providers);
+    # main.py sets LEKTURAI_THREADPOOL_SIZE in production mode, anyio's default is 40
+    threadpool_size = os.getenv("LEKTURAI_THREADPOOL_SIZE")
+    if threadpool_size:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(threadpool_size)
+    warmup.start()
+    yield
+    warmup.stop()
+    school_catalog.stop()
+    if get_sapling_service.cache_info().currsize:
+        get_sapling_service().close()
+    if not db_manager_initialized():
+        return
+    if db_manager.stats_invalidation is not None:
+        db_manager.stats_invalidation.close()
+    # Pending stats increments must not be lost on deploys
+    if db_manager.write_behind is not None:
+        db_manager.write_behind.close()
+    if db_manager.leaderboard_buffer is not None:
+        db_manager.leaderboard_buffer.close()
 
-app = FastAPI(title="LekturAI Backend")
+
+app = FastAPI(title="LekturAI Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,8 +68,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],        # Allow all HTTP methods
     allow_headers=["*"],        # Allow all headers
+    expose_headers=["X-Next-Cursor", "ETag", "X-Firestore-Reads"],  # History cursor, /cities caching, FIRESTORE_READ_COUNTING
 )
 
+
+class FirestoreRequestScope:
+    """
+    Reads within one request are deduplicated and batched (see DocumentLoader).
+    A plain ASGI middleware, so the scope only ends once the response has been
+    sent: StreamingResponse bodies (/history_export) read while they are sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Before warm-up has built the manager, building it here would block the event loop
+        if scope["type"] != "http" or not db_manager_initialized():
+            await self.app(scope, receive, send)
+            return
+
+        with db_manager.request_scope() as reads:
+
+            async def send_with_reads(message: Message) -> None:
+                if message["type"] == "http.response.start" and db_manager.COUNT_READS:
+                    # Reads of a streamed body come after the headers and are not included
+                    MutableHeaders(scope=message)["X-Firestore-Reads"] = str(reads.reads)
+                await send(message)
+
+            await self.app(scope, receive, send_with_reads)
+
+
+app.add_middleware(FirestoreRequestScope)
+
 app.include_router(history.router)
 app.include_router(exercises.router)
 app.include_router(schools.router)
@@ -22,4 +110,13 @@ app.include_router(stats.router)
 
 @app.get("/")
 def root() -> dict[str, str]:
-    return {"message": "LekturAI API is running"}
\ No newline at end of file
+    return {"message": "LekturAI API is running"}
+
+
+## READINESS: 200 once warm-up is done (clients built, caches loaded), 503 before
+@app.get("/ready")
+def ready(response: Response) -> dict[str, Any]:
+    status = warmup.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
\ No newline at end of file
@@ -1,3 +1,4 @@
+import logging
 import random
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -10,6 +11,8 @@ from app.schemas import (
     MaturaSubmit,
     ReadingExerciseGen,
     ReadingExerciseSubmit,
+    RecentQuestion,
+    UserHistoryEntry,
 )
 
 # Import the service and dependency
@@ -18,6 +21,8 @@ from app.services.sapling_service import SaplingService, get_sapling_service
 
 from ..db_utils import db_manager
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(tags=["Exercises"])
 
 # --- Lektury ---
@@ -88,9 +93,24 @@ def grade_reading_exercise(
     # Czy grade może być int?
     try:
         grade_str, feedback = ai_response.split("#GRADE_SEP#", 1)
-        db_manager.update_stats_after_ex(user_id, int(float(grade_str.strip())*10))
-        db_manager.update_daily_stats(user_id, int(float(grade_str.strip())*10))
-        db_manager.save_readings_to_history(user_id, submission, int(float(grade_str.strip())*10), feedback.strip())
+        db_manager.record_exercise_result(
+            user_id,
+            UserHistoryEntry(
+                type="reading",
+                question=submission.excercise_text,
+                response=submission.user_answer,
+                eval=feedback.strip(),
+                points=int(float(grade_str.strip())*10),
+            ),
+            recent=RecentQuestion(
+                type="reading",
+                title=submission.excercise_title,
+                description=submission.excercise_text,
+                user_answer=submission.user_answer,
+                feedback=feedback.strip(),
+                grade=float(grade_str.strip()),
+            ),
+        )
         return GradeResponse(
             grade=float(grade_str.strip()),
             feedback=feedback.strip(),
@@ -109,26 +129,11 @@ def grade_reading_exercise(
 
 @router.get("/matura_ex", response_model=MaturaExercise)
 def get_random_matura_task() -> MaturaExercise:
-    exam = None
-    try:
-        # Pobierz pierwszy dostępny egzamin (lub losowy z puli)
-        exams_query = db_manager.db.collection(db_manager.EXAMS_COLLECTION).limit(5)
-        docs = list(exams_query.stream())
-        if not docs:
-            raise HTTPException(status_code=404, detail="Brak egzaminów w bazie.")
-
-        # Losujemy jeden dokument
-        doc = random.choice(docs)
-        exam = db_manager.get_exam(doc.id)
-        if not exam:
-            raise HTTPException(
-                status_code=404, detail="Nie udało się odczytać egzaminu z bazy."
-            )
-    except Exception as e:
-        print(f"Błąd pobierania egzaminu z Firestore: {e}")
-        raise HTTPException(
-            status_code=500, detail="Błąd serwera podczas pobierania egzaminu."
-        )
+    # Pobierz pierwsze dostępne egzaminy i wylosuj jeden (bez ponownego odczytu)
+    exams = db_manager.get_exams(limit=5)
+    if not exams:
+        raise HTTPException(status_code=404, detail="Brak egzaminów w bazie.")
+    exam = random.choice(exams)
 
     questions = db_manager.get_exam_questions(exam.id) if exam and exam.id else []
     if not questions:
@@ -187,15 +192,12 @@ def solve_matura_task(
     except ValueError:
         raise HTTPException(status_code=400, detail="Nieprawidłowe ID zadania.")
 
-    # Pobieranie danych z bazy
-    exam = db_manager.get_exam(exam_id)
+    # Pobieranie danych z bazy (egzamin + pytania w jednym get_all)
+    exam, questions, answers_map = db_manager.get_exam_content(exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Egzamin nie istnieje.")
 
-    questions = db_manager.get_exam_questions(exam_id)
     question = next((q for q in questions if q.number == question_number), None)
-
-    answers_map = db_manager.get_exam_answers(exam_id)
     answer = answers_map.get(question_number)
 
     if not question or not answer:
@@ -265,10 +267,23 @@ def solve_matura_task(
 
         grade_val = float(grade_str)
 
-        db_manager.update_stats_after_ex(user_id, int(float(grade_val)*10))
-        db_manager.update_daily_stats(user_id, int(float(grade_val)*10))
-        db_manager.save_matura_ex_to_history(
-            user_id, question.text, submission.user_answer, int(float(grade_val)*10), feedback.strip()
+        db_manager.record_exercise_result(
+            user_id,
+            UserHistoryEntry(
+                type="reading",
+                question=question.text,
+                response=submission.user_answer,
+                eval=feedback.strip(),
+                points=int(float(grade_val)*10),
+            ),
+            recent=RecentQuestion(
+                type="matura",
+                title=f"Zadanie {question.number}",
+                description=question.text,
+                user_answer=submission.user_answer,
+                feedback=feedback.strip(),
+                grade=grade_val,
+            ),
         )
 
         return MaturaGradeResponse(
@@ -280,7 +295,7 @@ def solve_matura_task(
             ai_detection_score=ai_detection_score,
         )
     except (ValueError, IndexError) as e:
-        print(f"Błąd parsowania odpowiedzi Matura AI: {e}")
+        logger.warning("Błąd parsowania odpowiedzi Matura AI: %s", e)
         return MaturaGradeResponse(
             excercise_id=excercise_id,
             user_answer=submission.user_answer,
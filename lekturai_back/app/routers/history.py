@@ -1,52 +1,218 @@
-from typing import Optional, List
-from fastapi import APIRouter, Query
+import csv
+import io
+import json
+import zlib
+from typing import Iterator, Literal, Optional, List, overload
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from app.schemas import RecentQuestion, UserHistoryEntry
+from app.schemas import HistorySearchHit, RecentQuestion, UserHistoryEntry, UserHistorySummary
 from app.db_utils import db_manager
+from app.db_utils.db_service import encode_history_cursor
 
 router = APIRouter(tags=["History"])
 
-## SORT_BY = {date, points} 
-@router.get("/readings_history", response_model=List[UserHistoryEntry])
-def get_readings_history(user_id: str, sort_by: str, from_: int, to: int)->List[UserHistoryEntry]:
-    hist = db_manager.get_history_by_range(user_id, "reading", sort_by, from_, to)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@overload
+def _history_page(
+    response: Response,
+    user_id: str,
+    type_filter: str,
+    sort_by: str,
+    from_: Optional[int],
+    to: Optional[int],
+    cursor: Optional[str],
+    page_size: int,
+    summary: Literal[False] = False,
+) -> List[UserHistoryEntry]: ...
+
+
+@overload
+def _history_page(
+    response: Response,
+    user_id: str,
+    type_filter: str,
+    sort_by: str,
+    from_: Optional[int],
+    to: Optional[int],
+    cursor: Optional[str],
+    page_size: int,
+    summary: Literal[True],
+) -> List[UserHistorySummary]: ...
+
+
+def _history_page(
+    response: Response,
+    user_id: str,
+    type_filter: str,
+    sort_by: str,
+    from_: Optional[int],
+    to: Optional[int],
+    cursor: Optional[str],
+    page_size: int,
+    summary: bool = False,
+) -> List[UserHistoryEntry] | List[UserHistorySummary]:
+    # Compatibility mode: explicit from_/to positions (offset-based)
+    if from_ is not None and to is not None:
+        hist = db_manager.get_history_by_range(
+            user_id, type_filter, sort_by, from_, to, summary=summary
+        )
+        if hist and len(hist) == to - from_ + 1:
+            response.headers[NEXT_CURSOR_HEADER] = encode_history_cursor(sort_by, hist[-1])
+        return hist
+
+    try:
+        hist, next_cursor = db_manager.get_history_page(
+            user_id, type_filter, sort_by, page_size, cursor, summary=summary
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return hist
 
+
+## SORT_BY = {date, points}
+## Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+## from_/to (positions, offset-based) are still accepted for older clients.
+@router.get("/readings_history", response_model=List[UserHistoryEntry])
+def get_readings_history(
+    response: Response,
+    user_id: str,
+    sort_by: str = Query("date", pattern="^(date|points)$"),
+    from_: Optional[int] = None,
+    to: Optional[int] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(10, ge=1, le=100),
+)->List[UserHistoryEntry]:
+    return _history_page(response, user_id, "reading", sort_by, from_, to, cursor, page_size)
+
 @router.get("/exercise_history", response_model=List[UserHistoryEntry])
-def get_exercise_history(user_id: str, sort_by: str, from_: int, to: int)->List[UserHistoryEntry]:
-    hist = db_manager.get_history_by_range(user_id, "exercise", sort_by, from_, to)
-    return hist
+def get_exercise_history(
+    response: Response,
+    user_id: str,
+    sort_by: str = Query("date", pattern="^(date|points)$"),
+    from_: Optional[int] = None,
+    to: Optional[int] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(10, ge=1, le=100),
+)->List[UserHistoryEntry]:
+    return _history_page(response, user_id, "exercise", sort_by, from_, to, cursor, page_size)
+
+
+# Lightweight list views: type, question, points and date only
+@router.get("/readings_history/summary", response_model=List[UserHistorySummary])
+def get_readings_history_summary(
+    response: Response,
+    user_id: str,
+    sort_by: str = Query("date", pattern="^(date|points)$"),
+    from_: Optional[int] = None,
+    to: Optional[int] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(10, ge=1, le=100),
+)->List[UserHistorySummary]:
+    return _history_page(
+        response, user_id, "reading", sort_by, from_, to, cursor, page_size, summary=True
+    )
+
+@router.get("/exercise_history/summary", response_model=List[UserHistorySummary])
+def get_exercise_history_summary(
+    response: Response,
+    user_id: str,
+    sort_by: str = Query("date", pattern="^(date|points)$"),
+    from_: Optional[int] = None,
+    to: Optional[int] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(10, ge=1, le=100),
+)->List[UserHistorySummary]:
+    return _history_page(
+        response, user_id, "exercise", sort_by, from_, to, cursor, page_size, summary=True
+    )
+
+# Full entry (response + eval) for the detail screen
+@router.get("/history/{entry_id}", response_model=UserHistoryEntry)
+def get_history_entry(entry_id: str, user_id: str)->UserHistoryEntry:
+    entry = db_manager.get_history_entry(user_id, entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Wpis historii nie istnieje.")
+    return entry
 
 
 @router.get("/recent_questions", response_model=List[RecentQuestion])
-def get_recent_questions() -> List[RecentQuestion]:
-    """Return a list of recent questions seen by the user.
+def get_recent_questions(user_id: str) -> List[RecentQuestion]:
+    """Return a list of recent questions seen by the user, newest first.
     `type` may be one of: "reading", "matura", "otwarte", "zamkniete".
     """
-    # WIT_TODO: AI mocked data — replace with DB queries in future
-    return [
-        RecentQuestion(
-            type="reading",
-            title="Pan Tadeusz - Inwokacja",
-            description="Zinterpretuj początek utworu i wskaż epitetu.",
-            user_answer="W mojej opinii inwokacja...",
-            feedback="Dobrze uchwycone epitety, dodaj jeszcze kontekst historyczny.",
-            grade=4.0,
-        ),
-        RecentQuestion(
-            type="matura",
-            title="Matura 2025 - zadanie 2",
-            description="Analiza fragmentu prozy.",
-            user_answer="Odpowiedź maturalna...",
-            feedback="Brak rozwinięcia argumentacji.",
-            grade=3.0,
-        ),
-        RecentQuestion(
-            type="otwarte",
-            title="Zadanie otwarte: rozprawka",
-            description="Napisz rozprawkę na temat roli pamięci w literaturze.",
-            user_answer="Pamięć odgrywa rolę...",
-            feedback="Struktura ok, potrzebne przykłady z tekstów.",
-            grade=4.2,
-        ),
-    ]
\ No newline at end of file
+    return db_manager.get_recent_questions(user_id)
+
+
+# --- Export ---
+
+EXPORT_COLUMNS = ["id", "type", "date", "points", "question", "response", "eval"]
+
+
+def _export_rows(user_id: str, format: str) -> Iterator[bytes]:
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue().encode()
+
+    for entry in db_manager.iter_history_entries(user_id):
+        row = entry.model_dump(mode="json")
+        if format == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([row[col] for col in EXPORT_COLUMNS])
+            yield buffer.getvalue().encode()
+        else:
+            yield (json.dumps({col: row[col] for col in EXPORT_COLUMNS}, ensure_ascii=False) + "\n").encode()
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    # wbits=16+MAX_WBITS writes a gzip header, compressed on the fly
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+## FORMAT = {ndjson, csv}
+@router.get("/history_export")
+def export_history(
+    user_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+) -> StreamingResponse:
+    """Streams the user's whole history (oldest first) as NDJSON or CSV."""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"history.{format}"
+    body = _export_rows(user_id, format)
+
+    if gzip:
+        body = _gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# --- Search ---
+
+@router.get("/history_search", response_model=List[HistorySearchHit])
+def search_history(
+    user_id: str,
+    q: str = Query(..., min_length=2),
+    limit: int = Query(10, ge=1, le=50),
+)->List[HistorySearchHit]:
+    """Full-text search over the user's questions, answers and feedback (best match first)."""
+    return db_manager.search_history(user_id, q, limit)
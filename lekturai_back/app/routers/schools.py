@@ -1,18 +1,34 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request, Response
 from app.schemas import City, School, SchoolAssign, ClassAssign
+from app.services.school_catalog import school_catalog
 
 router = APIRouter(tags=["Schools & Classes"])
 
+## Served from the in-memory catalog (no Firestore reads)
+## Without name_so_far: the full city list, cacheable by ETag (it changes a few times a year)
 @router.get("/cities", response_model=list[City])
-def autocomplete_cities(name_so_far: str | None = "") -> list[City]:
-    return [City(name="Warszawa"), City(name="Wrocław")]
+def autocomplete_cities(
+    request: Request,
+    response: Response,
+    name_so_far: str | None = "",
+    limit: int = Query(10, ge=1, le=50),
+) -> list[City] | Response:
+    index = school_catalog.index
+    if name_so_far:
+        return index.search_cities(name_so_far, limit)
+
+    etag = index.cities_etag
+    client_etags = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in client_etags.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return index.cities
 
 @router.get("/schools", response_model=list[School])
-def get_schools(city: str) -> list[School]:
-    return [
-        School(school_id=1, school_name="LO nr 1"),
-        School(school_id=2, school_name="Technikum nr 5")
-    ]
+def get_schools(city: str, name_so_far: str | None = "", limit: int = Query(20, ge=1, le=100)) -> list[School]:
+    return school_catalog.index.search_schools(name_so_far or "", city=city, limit=limit)
 
 @router.post("/schools")
 def assign_user_to_school(data: SchoolAssign) -> dict[str, str | int]:
@@ -1,3 +1,4 @@
+import logging
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -5,6 +6,8 @@ from app.db_utils import db_manager
 from app.schemas import ContextRequest, FoundContext
 from app.services.ai_service import AIService, get_ai_service
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(tags=["Search & Assistant"])
 
 
@@ -68,7 +71,7 @@ def find_contexts(
                     )
                 )
         except Exception as e:
-            print(f"Skipping malformed context item: {item} | Error: {e}")
+            logger.warning("Skipping malformed context item: %s | Error: %s", item, e)
             continue
     
     # prolonging the learning streak but not granting points
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from typing import List
 from app.schemas import *
 from app.db_utils import db_manager
@@ -42,4 +42,23 @@ def get_school_avg_daily_stats(school_name: str, city: str):
 def get_school_avg_daily_stats(school_name: str, city: str, class_name: str):
     stats: List[UserDailyStats] = db_manager.get_daily_avg(school_name, city, class_name)
 
-    return stats
\ No newline at end of file
+    return stats
+
+@router.get("/school_leaderboard", response_model=List[LeaderboardEntry])
+def get_school_leaderboard(school_name: str, city: str, limit: int = Query(10, ge=1, le=50)) -> List[LeaderboardEntry]:
+    return db_manager.get_leaderboard(school_name, city, None, limit)
+
+@router.get("/class_leaderboard", response_model=List[LeaderboardEntry])
+def get_class_leaderboard(
+    school_name: str, city: str, class_name: str, limit: int = Query(10, ge=1, le=50)
+) -> List[LeaderboardEntry]:
+    return db_manager.get_leaderboard(school_name, city, class_name, limit)
+
+## SCOPE = {class, school}
+@router.get("/user_rank", response_model=UserRank)
+def get_user_rank(user_id: str, scope: str = Query("class", pattern="^(class|school)$")) -> UserRank:
+    rank = db_manager.get_user_rank(user_id, scope)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Użytkownik nie jest przypisany do szkoły/klasy.")
+
+    return rank
@@ -1,7 +1,9 @@
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from app.text_utils import decompress_text
 
 
 # --- Auth ---
@@ -35,6 +37,27 @@ class UserHistoryEntry(BaseModel):
     date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     id: Optional[str] = Field(None, alias="doc_id")
 
+    # Long texts may be stored compressed (see compress_text_fields);
+    # they are only decoded when a full entry is read
+    @field_validator("response", "eval", mode="before")
+    @classmethod
+    def _decompress(cls, value: Any) -> Any:
+        return decompress_text(value)
+
+
+# Fields needed by history list views (no essay / feedback text)
+class UserHistorySummary(BaseModel):
+    type: str
+    question: str
+    points: int
+    date: datetime
+    id: Optional[str] = Field(None, alias="doc_id")
+
+
+class HistorySearchHit(BaseModel):
+    score: float
+    entry: UserHistorySummary
+
 
 # USER
 class User(BaseModel):
@@ -71,6 +94,22 @@ class UserDailyStats(BaseModel):
 class AvgDailyScores(BaseModel):
     avg_points: float
 
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    display_name: str
+    points: int
+    current_streak: int
+
+
+class UserRank(BaseModel):
+    scope: str
+    # None when the user is outside the stored top-K
+    rank: Optional[int] = None
+    points: Optional[int] = None
+    leaderboard_size: int
+
 # --- Exercises (Lektury) ---
 class ReadingExerciseGen(BaseModel):
     excercise_title: str
@@ -115,6 +154,7 @@ class MaturaGradeResponse(BaseModel):
 # --- Schools ---
 class City(BaseModel):
     name: str
+    school_count: int = 0
 
 
 class School(BaseModel):
@@ -1,48 +1,72 @@
 import logging
 import os
+from functools import lru_cache
+from typing import Any, Callable
 
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from google import genai
-from google.genai.errors import APIError, ClientError, ServerError
-
-# Importy Tenacity
-from tenacity import (
-    before_sleep_log,
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_exponential,
-)
+
+from app.import_utils import lazy_module
 
 load_dotenv()
 
+# google.genai i tenacity ładujemy dopiero przy pierwszym użyciu (szybszy start serwera)
+genai = lazy_module("google.genai")
+genai_errors = lazy_module("google.genai.errors")
+
 # Konfiguracja loggera, aby widzieć, kiedy Tenacity ponawia próbę
-logger = logging.getLogger("uvicorn.error")
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+@lru_cache(maxsize=None)
+def _retry_policy() -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    from tenacity import (
+        before_sleep_log,
+        retry,
+        retry_if_exception_type,
+        stop_after_attempt,
+        wait_exponential,
+    )
+
+    return retry(
+        retry=retry_if_exception_type((genai_errors.ServerError, genai_errors.APIError)),
+        wait=wait_exponential(multiplier=1, min=1, max=10),
+        stop=stop_after_attempt(5),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True,
+    )
 
 
 class AIService:
     def __init__(self):
         self.api_key = os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
-            print("WARNING: GEMINI_API_KEY not found in environment variables.")
+            logger.warning("GEMINI_API_KEY not found in environment variables.")
             self.client = None
         else:
             self.client = genai.Client(api_key=self.api_key)
 
-    @retry(
-        retry=retry_if_exception_type((ServerError, APIError)),
-        wait=wait_exponential(multiplier=1, min=1, max=10),
-        stop=stop_after_attempt(5),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        reraise=True,
-    )
+    def warm_up(self) -> None:
+        """
+        Rozgrzewka przy starcie: pobiera metadane modelu (bez generowania),
+        żeby pierwsze zapytanie nie płaciło za połączenie TLS i import SDK.
+        Błędy tylko logujemy - brak Gemini nie blokuje reszty API.
+        """
+        if not self.client:
+            return
+        try:
+            self.client.models.get(model=DEFAULT_MODEL)
+        except Exception as e:
+            logger.warning("Gemini warm-up failed: %s", e)
+
     def _send_request_safe(self, model: str, contents: str, config: dict):
         """
         Wewnętrzna metoda wykonująca surowe zapytanie do API.
         To tutaj dzieje się magia ponawiania prób przez Tenacity.
         """
-        return self.client.models.generate_content(
+        return _retry_policy()(self.client.models.generate_content)(
             model=model, contents=contents, config=config
         )
 
@@ -50,7 +74,7 @@ class AIService:
         self,
         prompt: str,
         system_instruction: str = None,
-        model: str = "gemini-2.5-flash",
+        model: str = DEFAULT_MODEL,
     ) -> str:
         """
         Publiczna metoda wywoływana przez API.
@@ -76,21 +100,23 @@ class AIService:
 
             return response.text
 
-        except (APIError, ServerError) as e:
+        except (genai_errors.APIError, genai_errors.ServerError) as e:
             # Wykona się dopiero, gdy Tenacity zużyje wszystkie 5 prób
-            logger.error(f"Gemini API Critical Failure after retries: {e}")
+            logger.error("Gemini API Critical Failure after retries: %s", e)
             raise HTTPException(
                 status_code=502,
                 detail=f"External AI provider unavailable after retries. Error: {str(e)}",
             )
-        except ClientError as e:
+        except genai_errors.ClientError as e:
             # Błędy 4xx (złe zapytanie) - nie chcemy tego ponawiać
-            logger.error(f"Gemini Client Error (Bad Request): {e}")
+            logger.error("Gemini Client Error (Bad Request): %s", e)
             raise HTTPException(status_code=400, detail=f"Invalid AI Request: {str(e)}")
         except Exception as e:
-            logger.error(f"Unexpected AI Service Error: {e}")
+            logger.error("Unexpected AI Service Error: %s", e)
             raise HTTPException(status_code=500, detail="Internal AI Service Error.")
 
 
+# Jeden klient Gemini na proces (tworzony przy rozgrzewce albo pierwszym zapytaniu)
+@lru_cache(maxsize=None)
 def get_ai_service() -> AIService:
     return AIService()
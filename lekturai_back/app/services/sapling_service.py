@@ -1,23 +1,44 @@
 import logging
 import os
+from functools import lru_cache
 
-import requests
 from dotenv import load_dotenv
 from fastapi import HTTPException
 
+from app.import_utils import lazy_module
+
 load_dotenv()
 
-logger = logging.getLogger("uvicorn.error")
+requests = lazy_module("requests")
+
+logger = logging.getLogger(__name__)
 
 
 class SaplingService:
     """Service for detecting AI-generated text using Sapling AI API."""
 
-    def __init__(self):
+    def __init__(self) -> None:
         self.api_key = os.environ.get("SAPLING_API_KEY")
         self.api_url = "https://api.sapling.ai/api/v1/aidetect"
         if not self.api_key:
             logger.warning("SAPLING_API_KEY not found in environment variables. AI detection will be disabled.")
+        # Keep-alive: later requests reuse the open TLS connection
+        self.session = requests.Session()
+
+    def warm_up(self) -> None:
+        """
+        Opens the pooled connection to Sapling at start-up (a HEAD request,
+        no detection credits are used). Failures are only logged.
+        """
+        if not self.api_key:
+            return
+        try:
+            self.session.head(self.api_url, timeout=5)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Sapling warm-up failed: %s", e)
+
+    def close(self) -> None:
+        self.session.close()
 
     def detect_ai_text(self, text: str) -> float | None:
         """
@@ -38,7 +59,7 @@ class SaplingService:
             return None
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
                 json={
                     "key": self.api_key,
@@ -53,12 +74,13 @@ class SaplingService:
                 if score is not None:
                     return float(score)
                 else:
-                    logger.warning(f"Sapling API response missing 'score' field: {result}")
+                    logger.warning("Sapling API response missing 'score' field: %s", result)
                     return None
             else:
                 logger.error(
-                    f"Sapling API error: status_code={response.status_code}, "
-                    f"response={response.text}"
+                    "Sapling API error: status_code=%s, response=%s",
+                    response.status_code,
+                    response.text,
                 )
                 return None
 
@@ -66,16 +88,18 @@ class SaplingService:
             logger.error("Sapling API request timed out.")
             return None
         except requests.exceptions.RequestException as e:
-            logger.error(f"Sapling API request failed: {e}")
+            logger.error("Sapling API request failed: %s", e)
             return None
         except (ValueError, KeyError) as e:
-            logger.error(f"Error parsing Sapling API response: {e}")
+            logger.error("Error parsing Sapling API response: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error in Sapling AI detection: {e}")
+            logger.error("Unexpected error in Sapling AI detection: %s", e)
             return None
 
 
+# One instance per process, like get_ai_service
+@lru_cache(maxsize=None)
 def get_sapling_service() -> SaplingService:
     return SaplingService()
 
@@ -0,0 +1,179 @@
+import bisect
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.db_utils import db_manager
+from app.schemas import City, School
+from app.text_utils import normalize
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _fold(text: str) -> str:
+    return " ".join(_WORD_RE.findall(normalize(text)))
+
+
+class _PrefixArray:
+    """Sorted (key, word_pos, idx) entries of a set of folded school names."""
+
+    def __init__(self, names: List[str], ids: Sequence[int]) -> None:
+        entries = []
+        for idx in ids:
+            for word_pos, match in enumerate(_WORD_RE.finditer(names[idx])):
+                entries.append((names[idx][match.start():], word_pos, idx))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.entries = [(word_pos, idx) for _, word_pos, idx in entries]
+        self.ids = sorted(set(ids), key=names.__getitem__)
+
+    def matches(self, query: str) -> Iterator[Tuple[int, int]]:
+        i = bisect.bisect_left(self.keys, query)
+        while i < len(self.keys) and self.keys[i].startswith(query):
+            yield self.entries[i]
+            i += 1
+
+
+class SchoolIndex:
+    """
+    Immutable in-memory index of the school catalog.
+
+    Every school is stored in a sorted array under each word-suffix of its
+    folded name ("i liceum im. batorego" -> "i liceum im batorego",
+    "liceum im batorego", "im batorego", "batorego"), so a case and
+    diacritic insensitive prefix lookup is a bisect plus a short scan.
+    Each city has its own array, so /schools?city=... only scans that city.
+    """
+
+    def __init__(self, schools: List[School]) -> None:
+        self.schools = schools
+        self._names = [_fold(s.name) for s in schools]
+
+        by_city: Dict[str, List[int]] = defaultdict(list)
+        for idx, school in enumerate(schools):
+            by_city[_fold(school.city)].append(idx)
+
+        self._all = _PrefixArray(self._names, range(len(schools)))
+        self._by_city = {city: _PrefixArray(self._names, ids) for city, ids in by_city.items()}
+
+        # Distinct cities: "Wrocław", "wroclaw " and "WROCŁAW" are one city,
+        # shown with its most common spelling
+        spellings: Dict[str, Counter[str]] = defaultdict(Counter)
+        for school in schools:
+            spellings[_fold(school.city)][school.city.strip()] += 1
+        self.cities = [
+            City(name=names.most_common(1)[0][0], school_count=sum(names.values()))
+            for _, names in sorted(spellings.items())
+        ]
+        self._city_keys = sorted(spellings)
+        payload = json.dumps([c.model_dump() for c in self.cities], ensure_ascii=False)
+        self.cities_etag = '"' + hashlib.sha1(payload.encode()).hexdigest() + '"'
+
+    def __len__(self) -> int:
+        return len(self.schools)
+
+    def search_schools(self, prefix: str, city: Optional[str] = None, limit: int = 10) -> List[School]:
+        """
+        Top `limit` schools whose name (or a word of it) starts with `prefix`.
+        Matches at the start of the name rank first, then shorter names.
+        """
+        array = self._by_city.get(_fold(city)) if city else self._all
+        if array is None:
+            return []
+
+        query = _fold(prefix)
+        if not query:
+            return [self.schools[idx] for idx in array.ids[:limit]]
+
+        best: Dict[int, Tuple[bool, int, str]] = {}
+        for word_pos, idx in array.matches(query):
+            rank = (word_pos > 0, len(self._names[idx]), self._names[idx])
+            if idx not in best or rank < best[idx]:
+                best[idx] = rank
+
+        top = heapq.nsmallest(limit, best.items(), key=lambda item: item[1])
+        return [self.schools[idx] for idx, _ in top]
+
+    def search_cities(self, prefix: str, limit: int = 10) -> List[City]:
+        """Top `limit` cities starting with `prefix`, the ones with most schools first."""
+        query = _fold(prefix)
+        lo = bisect.bisect_left(self._city_keys, query)
+        hi = lo
+        while hi < len(self._city_keys) and self._city_keys[hi].startswith(query):
+            hi += 1
+        return heapq.nsmallest(limit, self.cities[lo:hi], key=lambda c: -c.school_count)
+
+
+class SchoolCatalog:
+    """
+    Holds the current SchoolIndex and rebuilds it from `loader` every
+    `refresh_seconds` on a background thread. Readers never wait: the new
+    index replaces the old one with a single attribute swap.
+    An empty first load raises (unless `allow_empty`), so the warm-up retries
+    it instead of serving an empty catalog until the next refresh.
+    """
+
+    def __init__(
+        self, loader: Callable[[], List[School]], refresh_seconds: float, allow_empty: bool = False
+    ) -> None:
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.allow_empty = allow_empty
+        self.index = SchoolIndex([])
+        self.loaded_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        schools = self._loader()
+        # get_all_schools returns [] on errors; keep serving the old catalog then
+        if not schools and len(self.index):
+            logger.warning("School catalog reload returned nothing, keeping %d schools.", len(self.index))
+            return False
+        if not schools and self.loaded_at is None and not self.allow_empty:
+            raise RuntimeError("School catalog load returned no schools.")
+        self.index = SchoolIndex(schools)
+        self.loaded_at = time.time()
+        logger.info("School catalog loaded: %d schools.", len(schools))
+        return True
+
+    def start(self) -> None:
+        """Loads the catalog now and keeps refreshing it until stop()."""
+        self.refresh()
+        if self._thread is None and self.refresh_seconds > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="school-catalog", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("School catalog refresh failed: %s", e)
+
+
+def _load_schools() -> List[School]:
+    # Resolved per call: db_manager is built lazily (see app.db_utils)
+    return db_manager.get_all_schools()
+
+
+school_catalog = SchoolCatalog(
+    _load_schools,
+    refresh_seconds=float(os.getenv("SCHOOL_CATALOG_REFRESH_SECONDS", "3600")),
+    # The memory backend starts with no schools
+    allow_empty=os.getenv("STORAGE_BACKEND", "firestore").lower() == "memory",
+)
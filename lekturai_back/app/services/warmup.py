@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Runs the start-up steps (building clients, loading caches) on a
+    background thread, so the server accepts connections at once and
+    /ready answers 503 until every step has finished. Steps must be safe
+    to repeat: after a failure the whole list is retried every
+    `retry_seconds`.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]], retry_seconds: float = 10.0):
+        self.steps = steps
+        self.retry_seconds = retry_seconds
+        self.ready = False
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.durations: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run(self) -> bool:
+        """Runs all steps once; returns True when the server is ready."""
+        self.attempts += 1
+        for name, step in self.steps:
+            started = time.monotonic()
+            try:
+                step()
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                logger.error("Warm-up step '%s' failed: %s", name, e)
+                return False
+            finally:
+                self.durations[name] = round(time.monotonic() - started, 3)
+
+        self.error = None
+        self.finished_at = time.time()
+        self.ready = True
+        logger.info(
+            "Warm-up finished in %.2fs: %s",
+            self.finished_at - (self.started_at or self.finished_at),
+            ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.durations.items()),
+        )
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_until_ready, name="warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run_until_ready(self) -> None:
+        while not self.run():
+            if self._stop.wait(self.retry_seconds):
+                return
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "error": self.error,
+            "seconds": (
+                round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+            ),
+            "steps": dict(self.durations),
+        }
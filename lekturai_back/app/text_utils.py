@@ -0,0 +1,104 @@
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+# 'ł' has no Unicode decomposition, so NFKD alone would leave it untouched
+_EXTRA_FOLDS = str.maketrans({"ł": "l", "Ł": "L"})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Most frequent Polish function words (already folded)
+STOPWORDS = {
+    "a", "aby", "ale", "az", "bo", "by", "byc", "byl", "byla", "bylo", "byly",
+    "czy", "dla", "do", "gdy", "go", "i", "ich", "ja", "jak", "jako", "je",
+    "jego", "jej", "jest", "juz", "ktora", "ktore", "ktory", "lub", "ma", "mi",
+    "na", "nad", "nie", "o", "od", "on", "ona", "oraz", "po", "pod", "przez",
+    "przy", "sa", "sie", "sobie", "ta", "tak", "tam", "te", "tego", "tej",
+    "ten", "to", "tym", "tez", "u", "w", "we", "z", "za", "ze",
+}
+
+# Folded inflection endings, longest first
+_SUFFIXES = sorted(
+    [
+        "owaniami", "owania", "owanie", "osciami", "oscia", "osci", "osc",
+        "iego", "iemu", "iej", "ich", "imi", "ami", "ach", "owi", "ego", "emu",
+        "ymi", "ej", "ow", "om", "ie", "ia", "iu", "em", "ym", "im",
+        "a", "e", "i", "o", "u", "y",
+    ],
+    key=len,
+    reverse=True,
+)
+_MIN_STEM = 3
+
+
+def fold_diacritics(text: str) -> str:
+    """'Wrocław' -> 'Wroclaw', 'Żółć' -> 'Zolc'."""
+    decomposed = unicodedata.normalize("NFKD", text.translate(_EXTRA_FOLDS))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize(text: str) -> str:
+    """Lowercase and fold diacritics; used for search and autocomplete keys."""
+    return fold_diacritics(text).lower()
+
+
+def stem(token: str) -> str:
+    """Strips the longest known inflection ending, keeping at least 3 letters."""
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            return token[: -len(suffix)]
+    return token
+
+
+def index_terms(text: str) -> List[str]:
+    """Normalized, stemmed terms of `text` without stopwords (with repeats)."""
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(normalize(text))
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def term_frequencies(*texts: str) -> Dict[str, int]:
+    counts: Counter[str] = Counter()
+    for text in texts:
+        counts.update(index_terms(text))
+    return dict(counts)
+
+
+# --- Compressed storage of long text fields ---
+
+TEXT_CODEC = "zlib"
+TEXT_CODEC_VERSION = 1
+
+
+def compress_text_fields(
+    data: Dict[str, Any], fields: Iterable[str], min_bytes: int
+) -> Dict[str, Any]:
+    """
+    Replaces long string fields with {"codec", "version", "data": bytes}.
+    Short texts, and texts that do not shrink, are stored as plain strings.
+    """
+    result = dict(data)
+    for field in fields:
+        value = result.get(field)
+        if not isinstance(value, str):
+            continue
+        raw = value.encode()
+        if len(raw) < min_bytes:
+            continue
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw) * 0.9:
+            result[field] = {"codec": TEXT_CODEC, "version": TEXT_CODEC_VERSION, "data": packed}
+    return result
+
+
+def decompress_text(value: Any) -> Any:
+    """Inverse of compress_text_fields for one value; plain strings pass through."""
+    if not isinstance(value, dict) or "codec" not in value:
+        return value
+    if value["codec"] != TEXT_CODEC or value.get("version") != TEXT_CODEC_VERSION:
+        raise ValueError(f"Unsupported text codec: {value['codec']} v{value.get('version')}")
+    return zlib.decompress(value["data"]).decode()
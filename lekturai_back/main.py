@@ -1,14 +1,89 @@
+import logging
 import os
+from typing import Any, Dict
 
 import uvicorn
 from dotenv import load_dotenv
 
+from app.logging_config import setup_logging
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _cpu_count() -> int:
+    # Cores this process may run on (respects taskset/cpuset limits of the container)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def dev_config() -> Dict[str, Any]:
+    # Single process with a file watcher
+    return {"reload": True}
+
+
+def production_config() -> Dict[str, Any]:
+    """
+    Multi-process server; every value can be overridden with an env var.
+
+    - LEKTURAI_WORKERS: processes, default one per core. Each worker runs
+      its own warm-up and has its own caches.
+    - LEKTURAI_THREADPOOL_SIZE: threads per worker for the sync endpoints,
+      which block on Firestore, Gemini and Sapling. Applied in the app's
+      lifespan. Default 100: most of those threads wait on the network.
+    - LEKTURAI_LIMIT_CONCURRENCY: requests in flight per worker before
+      answering 503, so an overloaded worker sheds load instead of queueing.
+    - LEKTURAI_KEEP_ALIVE: idle keep-alive seconds. It must be longer than
+      the load balancer's idle timeout, otherwise the balancer reuses
+      connections we have already closed.
+    - LEKTURAI_GRACEFUL_SHUTDOWN: seconds to finish in-flight requests on
+      deploys (a Gemini grading can take a while).
+    - FORWARDED_ALLOW_IPS: addresses of the load balancer whose
+      X-Forwarded-* headers are trusted (uvicorn's default: 127.0.0.1).
+
+    The event loop and HTTP parser are left to uvicorn ("auto"): uvloop and
+    httptools when installed (uvicorn[standard]), asyncio and h11 otherwise.
+    """
+    workers = int(os.getenv("LEKTURAI_WORKERS", str(_cpu_count())))
+    if os.getenv("STORAGE_BACKEND", "firestore").lower() == "memory" and workers > 1:
+        # Every process would get its own, different store
+        logger.warning("STORAGE_BACKEND=memory: running a single worker.")
+        workers = 1
+
+    # Workers inherit the environment
+    os.environ.setdefault("LEKTURAI_THREADPOOL_SIZE", "100")
+
+    config: Dict[str, Any] = {
+        "workers": workers,
+        "timeout_keep_alive": int(os.getenv("LEKTURAI_KEEP_ALIVE", "75")),
+        "limit_concurrency": int(os.getenv("LEKTURAI_LIMIT_CONCURRENCY", "200")),
+        "timeout_graceful_shutdown": int(os.getenv("LEKTURAI_GRACEFUL_SHUTDOWN", "30")),
+        "backlog": int(os.getenv("LEKTURAI_BACKLOG", "2048")),
+        # Client addresses and https scheme from the load balancer's X-Forwarded-* headers
+        "proxy_headers": True,
+    }
+    if os.getenv("FORWARDED_ALLOW_IPS"):
+        # Otherwise uvicorn trusts only 127.0.0.1: any client could spoof the headers with "*"
+        config["forwarded_allow_ips"] = os.environ["FORWARDED_ALLOW_IPS"]
+    if os.getenv("LEKTURAI_MAX_REQUESTS"):
+        # Recycle workers after this many requests
+        config["limit_max_requests"] = int(os.environ["LEKTURAI_MAX_REQUESTS"])
+    return config
+
+
 if __name__ == "__main__":
+    # LEKTURAI_ENV=production: multi-worker server; anything else: dev server with reload
+    production = os.getenv("LEKTURAI_ENV", "dev").lower() in ("prod", "production")
+    setup_logging()
+    config = production_config() if production else dev_config()
+
     uvicorn.run(
         "app.main:app",
         host=os.getenv("LEKTURAI_URL", "0.0.0.0"),
         port=int(os.getenv("LEKTURAI_PORT", "8000")),
-        reload=True,
+        # uvicorn's own loggers go through app.logging_config as well
+        log_config=None,
+        **config,
     )
@@ -0,0 +1,214 @@
+# test_memory_store.py
+# Run from lekturai_back/: python -m pytest
+
+from typing import Any, List, Tuple
+
+import pytest
+from google.api_core import exceptions
+from google.cloud.firestore_v1.transforms import DELETE_FIELD, Increment
+
+from app.db_utils.backend import transactional
+from app.db_utils.memory_store import MemoryClient
+from app.db_utils.storage import DocumentRef, StorageClient
+
+
+@pytest.fixture
+def client() -> MemoryClient:
+    return MemoryClient()
+
+
+def ids(client_query: Any) -> List[str]:
+    return [doc.id for doc in client_query.stream()]
+
+
+def test_memory_client_implements_storage_client(client: MemoryClient) -> None:
+    storage: StorageClient = client
+    storage.collection("users").document("u1").set({"name": "Ala"})
+    assert storage.document("users/u1").get().to_dict() == {"name": "Ala"}
+
+
+# ---------------------------------
+# TRANSACTIONS AND BATCHES
+# ---------------------------------
+
+
+def test_transaction_commits_reads_and_writes_together(client: MemoryClient) -> None:
+    source = client.document("stats/a")
+    target = client.document("stats/b")
+    source.set({"points": 5})
+
+    @transactional
+    def move(transaction: Any, source: DocumentRef, target: DocumentRef) -> int:
+        points: int = (source.get(transaction=transaction).to_dict() or {})["points"]
+        transaction.update(source, {"points": 0})
+        transaction.set(target, {"points": Increment(points)}, merge=True)
+        # Writes are buffered until the function returns
+        assert not target.get().exists
+        return points
+
+    assert move(client.transaction(), source, target) == 5
+    assert source.get().to_dict() == {"points": 0}
+    assert target.get().to_dict() == {"points": 5}
+
+
+def test_failed_transaction_writes_nothing(client: MemoryClient) -> None:
+    ref = client.document("stats/a")
+    ref.set({"points": 1})
+
+    @transactional
+    def fail(transaction: Any) -> None:
+        transaction.update(ref, {"points": Increment(1)})
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        fail(client.transaction())
+    assert ref.get().to_dict() == {"points": 1}
+
+
+def test_batch_is_atomic(client: MemoryClient) -> None:
+    client.document("users/u1").set({"name": "Ala"})
+    batch = client.batch()
+    batch.set(client.document("users/u2"), {"name": "Ola"})
+    batch.create(client.document("users/u1"), {"name": "Ela"})
+
+    with pytest.raises(exceptions.AlreadyExists):
+        batch.commit()
+    assert not client.document("users/u2").get().exists
+    assert client.document("users/u1").get().to_dict() == {"name": "Ala"}
+
+
+def test_update_time_precondition(client: MemoryClient) -> None:
+    ref = client.document("stats/a")
+    ref.set({"points": 1})
+    stale = ref.get().update_time
+    ref.update({"points": 2})
+
+    with pytest.raises(exceptions.FailedPrecondition):
+        ref.update({"points": 3}, option=client.write_option(last_update_time=stale))
+    ref.update({"points": 3}, option=client.write_option(last_update_time=ref.get().update_time))
+    assert ref.get().get("points") == 3
+
+
+# ---------------------------------
+# WRITES AND TRANSFORMS
+# ---------------------------------
+
+
+def test_increment(client: MemoryClient) -> None:
+    ref = client.document("daily/u1")
+    ref.set({"points": Increment(2), "days": {"2024-01-01": Increment(1)}}, merge=True)
+    ref.set({"points": Increment(3), "days": {"2024-01-01": Increment(1.5)}}, merge=True)
+    ref.update({"days.`2024-01-02`": Increment(4), "name": Increment(1)})
+
+    assert ref.get().to_dict() == {
+        "points": 5,
+        "days": {"2024-01-01": 2.5, "2024-01-02": 4},
+        "name": 1,
+    }
+
+
+def test_increment_replaces_non_numeric_values(client: MemoryClient) -> None:
+    ref = client.document("daily/u1")
+    ref.set({"points": "x", "done": True})
+    ref.update({"points": Increment(2), "done": Increment(1)})
+    assert ref.get().to_dict() == {"points": 2, "done": 1}
+
+
+def test_set_replaces_and_merge_merges_maps(client: MemoryClient) -> None:
+    ref = client.document("users/u1")
+    ref.set({"a": {"x": 1, "y": 2}, "b": 1})
+    ref.set({"a": {"x": 3}}, merge=True)
+    assert ref.get().to_dict() == {"a": {"x": 3, "y": 2}, "b": 1}
+
+    ref.update({"a": {"z": 1}, "b": DELETE_FIELD})
+    assert ref.get().to_dict() == {"a": {"z": 1}}
+
+    ref.set({"c": 1})
+    assert ref.get().to_dict() == {"c": 1}
+
+
+def test_update_of_missing_document_fails(client: MemoryClient) -> None:
+    with pytest.raises(exceptions.NotFound):
+        client.document("users/missing").update({"a": 1})
+
+
+# ---------------------------------
+# ORDERING AND CURSORS
+# ---------------------------------
+
+
+def test_order_by_follows_firestore_type_order(client: MemoryClient) -> None:
+    values: List[Tuple[str, Any]] = [("s", "a"), ("i", 2), ("n", None), ("f", 1.5), ("b", True)]
+    for doc_id, value in values:
+        client.document(f"c/{doc_id}").set({"v": value})
+    client.document("c/missing").set({"other": 1})
+
+    # Documents without the field are left out
+    assert ids(client.collection("c").order_by("v")) == ["n", "b", "f", "i", "s"]
+
+
+def test_descending_order_breaks_ties_by_descending_id(client: MemoryClient) -> None:
+    for doc_id, points in [("a", 1), ("b", 2), ("c", 1), ("d", 2)]:
+        client.document(f"c/{doc_id}").set({"points": points})
+
+    assert ids(client.collection("c").order_by("points", direction="DESCENDING")) == ["d", "b", "c", "a"]
+
+
+def test_inequality_filter_orders_by_its_field(client: MemoryClient) -> None:
+    for doc_id, points in [("a", 3), ("b", 1), ("c", 2), ("d", 0)]:
+        client.document(f"c/{doc_id}").set({"points": points})
+
+    assert ids(client.collection("c").where("points", ">", 0)) == ["b", "c", "a"]
+
+
+def test_paging_with_snapshot_cursors(client: MemoryClient) -> None:
+    for i in range(7):
+        client.document(f"c/d{i}").set({"points": i % 3})
+    query = client.collection("c").order_by("points", direction="DESCENDING").limit(3)
+
+    pages: List[List[str]] = []
+    page = list(query.stream())
+    while page:
+        pages.append([doc.id for doc in page])
+        page = list(query.start_after(page[-1]).stream())
+
+    assert pages == [["d5", "d2", "d4"], ["d1", "d6", "d3"], ["d0"]]
+
+
+def test_value_cursors(client: MemoryClient) -> None:
+    for i in range(5):
+        client.document(f"c/d{i}").set({"points": i})
+    query = client.collection("c").order_by("points")
+
+    assert ids(query.start_at([1]).end_before([3])) == ["d1", "d2"]
+    assert ids(query.start_after({"points": 1}).end_at({"points": 3})) == ["d2", "d3"]
+    assert ids(query.offset(1).limit(2)) == ["d1", "d2"]
+    assert query.where("points", ">=", 2).count().get()[0][0].value == 3
+
+
+# ---------------------------------
+# SNAPSHOT LISTENERS
+# ---------------------------------
+
+
+def test_on_snapshot_reports_changes_until_unsubscribed(client: MemoryClient) -> None:
+    client.document("c/old").set({"at": 1})
+    calls: List[List[Tuple[str, str]]] = []
+
+    def on_snapshot(docs: Any, changes: Any, read_time: Any) -> None:
+        calls.append([(change.type.name, change.document.id) for change in changes])
+
+    watch = client.collection("c").where("at", ">", 0).on_snapshot(on_snapshot)
+    client.document("c/new").set({"at": 2})
+    client.document("c/new").update({"at": 3})
+    client.document("c/old").delete()
+    client.document("c/other").set({"at": 0})
+    watch.unsubscribe()
+    client.document("c/late").set({"at": 4})
+
+    assert calls == [
+        [("ADDED", "old")],
+        [("ADDED", "new")],
+        [("MODIFIED", "new")],
+        [("REMOVED", "old")],
+    ]
@@ -0,0 +1,98 @@
+# check_import_time.py
+#
+# Cold-start guard: imports app.main in a fresh interpreter with
+# `python -X importtime` and fails when the import takes longer than the
+# budget or loads a module that must stay lazy (those are loaded by the
+# warm-up, after the server is listening).
+#
+# Run from lekturai_back/: python utils/import_budget/check_import_time.py [--budget-ms 800]
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = 800
+# Repeated runs; the fastest one is compared with the budget (less noise)
+DEFAULT_RUNS = 3
+
+LAZY_MODULES = [
+    "firebase_admin",
+    "google.cloud.firestore",
+    "google.api_core",
+    "grpc",
+    "google.genai",
+    "tenacity",
+    "requests",
+]
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def measure(module: str) -> Tuple[int, Dict[str, int]]:
+    """Returns (total import time of `module` in µs, {imported module: cumulative µs})."""
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative[module], cumulative
+
+
+def lazy_offenders(cumulative: Dict[str, int]) -> List[str]:
+    return sorted(
+        name
+        for name in cumulative
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the import time of the API.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(max(args.runs, 1))]
+    total_us, cumulative = min(runs, key=lambda run: run[0])
+
+    slowest = sorted(
+        ((us, name) for name, us in cumulative.items() if name.count(".") == 0 and name != args.module),
+        reverse=True,
+    )[:10]
+    print(f"import {args.module}: {total_us / 1000:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for us, name in slowest:
+        print(f"  {us / 1000:7.1f} ms  {name}")
+
+    failed = False
+    offenders = lazy_offenders(cumulative)
+    if offenders:
+        roots = sorted({name.split(".")[0] for name in offenders})
+        print(f"FAIL: modules that must be imported lazily were loaded: {', '.join(roots)}")
+        failed = True
+    if total_us / 1000 > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())